@@ -1,11 +1,21 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, abort, Response
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from models import db, Usuario, Exercicio, Progresso, Transacao, ModuloConcluido
+from models import (db, Usuario, Exercicio, Progresso, Transacao, ModuloConcluido, EventoReembolso, STATUS_TRANSACAO_VISIVEIS,
+                    insert_com_conflito)
+from stripe_cliente import CachePrecos, ExecutorStripe, SdkStripe, StripeOcupado, StripeTimeout
+from webhooks import registrar_evento
+from chaves import ChaveiroSessao, SessaoComRotacao
+from estado_vidas import serializar_estado, versao_estado, formatar_evento
+from catalogo import obter_catalogo
+from modulos import MODULOS
+from progresso import (resumo_por_modulo, progresso_do_modulo, exercicios_concluidos, invalidar_concluidos,
+                       registrar_acerto, registrar_tentativa_errada)
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-import stripe
+import hmac
 import os
 import random
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -25,16 +35,23 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///codignarte.db'
     print("🔧 Modo desenvolvimento: SQLite local")
 
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(24)
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+# Sessões assinadas por chaves compartilhadas entre workers e instâncias, com rotação (ver chaves.py)
+chaveiro_sessao = ChaveiroSessao()
+app.session_interface = SessaoComRotacao(chaveiro_sessao)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_pre_ping': True,
     'pool_recycle': 300,
 }
 
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+# O SDK só é importado na primeira chamada à Stripe (pagamentos, webhooks, reembolsos)
+# STRIPE_API_BASE aponta para o stripe_falso.py em testes e benchmarks locais
+stripe = SdkStripe(api_key=os.environ.get('STRIPE_SECRET_KEY'), api_base=os.environ.get('STRIPE_API_BASE'))
 if not stripe.api_key:
     print("⚠️ AVISO: STRIPE_SECRET_KEY não configurada")
+if stripe.api_base:
+    print(f"🧪 Usando API da Stripe em {stripe.api_base}")
 STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
 
@@ -44,17 +61,38 @@ STRIPE_PRICE_IDS = {
     'vida_3': os.environ.get('STRIPE_PRICE_VIDA_3'),
     'vida_5': os.environ.get('STRIPE_PRICE_VIDA_5'),
 }
+# Chamadas à Stripe das rotas rodam neste pool limitado, com prazo por chamada
+executor_stripe = ExecutorStripe()
+cache_precos = CachePrecos(STRIPE_PRICE_IDS, buscar=lambda price_id: stripe.Price.retrieve(price_id),
+                           executor=executor_stripe)
+# Marcada pelo wsgi.preparar_worker ao fim do aquecimento; o /pronto também confere banco e schema
+prontidao = {'pronto': False, 'subida_ms': None, 'aquecimento': {}}
 
 print("=" * 60)
 print("🔍 VERIFICAÇÃO DE CONFIGURAÇÃO")
 print("=" * 60)
 print(f"✅ Banco: {'PostgreSQL' if database_url else 'SQLite'}")
-print(f"✅ SECRET_KEY: {'Configurado' if os.environ.get('SECRET_KEY') else '⚠️ Usando aleatório'}")
+print(f"✅ SECRET_KEY: {'Configurado' if chaveiro_sessao.origem == 'ambiente' else '🔐 Persistida no banco (chaves.py)'}")
 print(f"✅ STRIPE_SECRET_KEY: {'***' + stripe.api_key[-8:] if stripe.api_key else '❌ NÃO CONFIGURADO'}")
 print(f"✅ STRIPE_PUBLIC_KEY: {'***' + STRIPE_PUBLIC_KEY[-8:] if STRIPE_PUBLIC_KEY else '❌ NÃO CONFIGURADO'}")
 
 db.init_app(app)
 
+# /eventos/vidas é polling: intervalo em segundos entre as consultas do navegador (via `retry` do SSE)
+VIDAS_STREAM_RECONEXAO = int(os.environ.get('VIDAS_STREAM_RECONEXAO', 15))
+# Intervalo mínimo entre consultas à Stripe para a mesma sessão de checkout ainda pendente
+PAGAMENTO_VERIFICACAO_INTERVALO = int(os.environ.get('PAGAMENTO_VERIFICACAO_INTERVALO', 10))
+# Validade das sessões de checkout (a Stripe aceita de 30 min a 24 h) e janela das chaves de idempotência
+CHECKOUT_VALIDADE = int(os.environ.get('CHECKOUT_VALIDADE', 3600))
+CHECKOUT_JANELA_IDEMPOTENCIA = max(1, min(int(os.environ.get('CHECKOUT_JANELA_IDEMPOTENCIA', 60)), 600))
+# expires_at parte do início da janela, que pode ter passado há até uma janela inteira:
+# abaixo deste mínimo (mais 60 s de folga para relógio e latência) a Stripe recusaria os 30 min
+CHECKOUT_VALIDADE_MIN = 1800 + CHECKOUT_JANELA_IDEMPOTENCIA + 60
+if not CHECKOUT_VALIDADE_MIN <= CHECKOUT_VALIDADE <= 86400:
+    print(f"⚠️ CHECKOUT_VALIDADE={CHECKOUT_VALIDADE} fora do aceito pela Stripe, "
+          f"usando {min(max(CHECKOUT_VALIDADE, CHECKOUT_VALIDADE_MIN), 86400)} s")
+    CHECKOUT_VALIDADE = min(max(CHECKOUT_VALIDADE, CHECKOUT_VALIDADE_MIN), 86400)
+
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
@@ -63,57 +101,6 @@ login_manager.init_app(app)
 def load_user(user_id):
     return Usuario.query.get(int(user_id))
 
-MODULOS = {
-    'iniciante': [
-        {
-            'id': 'variaveis_operadores',
-            'nome': 'Variáveis e Operadores',
-            'descricao': 'Aprenda o básico da programação com variáveis e operações matemáticas',
-            'icone': 'fa-calculator',
-            'total_exercicios': 5
-        },
-        {
-            'id': 'estruturas_controle',
-            'nome': 'Estruturas de Controle',
-            'descricao': 'Controle o fluxo do seu código com condições e loops',
-            'icone': 'fa-sitemap',
-            'total_exercicios': 5
-        }
-    ],
-    'intermediario': [
-        {
-            'id': 'funcoes',
-            'nome': 'Funções',
-            'descricao': 'Aprenda a criar e usar funções para organizar seu código',
-            'icone': 'fa-cogs',
-            'total_exercicios': 5
-        },
-        {
-            'id': 'arrays_objetos',
-            'nome': 'Arrays e Objetos',
-            'descricao': 'Trabalhe com listas e objetos para armazenar dados',
-            'icone': 'fa-layer-group',
-            'total_exercicios': 5
-        }
-    ],
-    'avancado': [
-        {
-            'id': 'programacao_assincrona',
-            'nome': 'Programação Assíncrona',
-            'descricao': 'Domine callbacks, promises e async/await',
-            'icone': 'fa-bolt',
-            'total_exercicios': 5
-        },
-        {
-            'id': 'dom_manipulation',
-            'nome': 'Manipulação do DOM',
-            'descricao': 'Interaja com páginas web dinamicamente',
-            'icone': 'fa-window-restore',
-            'total_exercicios': 5
-        }
-    ]
-}
-
 def criar_dados_iniciais():
     try:
         if not Exercicio.query.first():
@@ -223,48 +210,46 @@ def criar_dados_iniciais():
         db.session.rollback()
 
 def init_database():
-    """Inicializa o banco de dados"""
+    """Inicializa o banco de dados (migrações e dados iniciais, sob o lock do bootstrap)"""
     try:
+        from migracoes import preparar_banco
         with app.app_context():
-            db.create_all()
-            criar_dados_iniciais()
+            preparar_banco(criar_dados_iniciais)
             print("✅ Banco de dados inicializado com sucesso!")
     except Exception as e:
         print(f"❌ Erro ao inicializar banco: {str(e)}")
 
 @app.before_request
 def verificar_premium():
-    if current_user.is_authenticated:
-        current_user.verificar_premium_expirado()
+    # is_premium_active já considera a data de expiração; só grava quando o status vira
+    if current_user.is_authenticated and current_user.verificar_premium_expirado():
         db.session.commit()
 
 @app.route('/')
 def index():
     tem_progresso = False
     if current_user.is_authenticated:
-        progresso = Progresso.query.filter_by(usuario_id=current_user.id).first()
-        tem_progresso = progresso is not None
+        tem_progresso = len(exercicios_concluidos(current_user)) > 0
     
     return render_template('index.html', tem_progresso=tem_progresso)
 
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    if not current_user.is_premium_active:
-        current_user.regenerar_vidas()
-    
     tempo_restante = current_user.tempo_para_proxima_vida()
-    db.session.commit()
     
-    progresso = Progresso.query.filter_by(usuario_id=current_user.id).all()
-    exercicios_completos = len(progresso)
+    exercicios_completos = len(exercicios_concluidos(current_user))
     novo_usuario = exercicios_completos == 0
     
-    transacoes = Transacao.query.filter_by(usuario_id=current_user.id).order_by(Transacao.data_transacao.desc()).all()
+    # O painel só mostra as 3 compras mais recentes
+    transacoes = Transacao.query.filter(
+        Transacao.usuario_id == current_user.id,
+        Transacao.status.in_(STATUS_TRANSACAO_VISIVEIS)
+    ).order_by(Transacao.data_transacao.desc()).limit(3).all()
     
     return render_template('dashboard.html', 
                          exercicios_completos=exercicios_completos,
-                         vidas=current_user.vidas,
+                         vidas=current_user.vidas_efetivas,
                          novo_usuario=novo_usuario,
                          tempo_restante=tempo_restante,
                          premium=current_user.is_premium_active,
@@ -278,9 +263,6 @@ def login():
         usuario = Usuario.query.filter_by(email=email).first()
         
         if usuario and check_password_hash(usuario.senha, senha):
-            if not usuario.is_premium_active:
-                usuario.regenerar_vidas()
-            db.session.commit()
             login_user(usuario)
             return redirect(url_for('dashboard'))
         else:
@@ -373,12 +355,17 @@ def delete_account():
         # Excluir módulos concluídos
         ModuloConcluido.query.filter_by(usuario_id=current_user.id).delete()
         
-        # Excluir transações
+        # Excluir transações e o histórico de reembolso delas
+        EventoReembolso.query.filter(EventoReembolso.transacao_id.in_(
+            db.session.query(Transacao.id).filter_by(usuario_id=current_user.id)
+        )).delete(synchronize_session=False)
         Transacao.query.filter_by(usuario_id=current_user.id).delete()
         
         # Excluir o usuário
+        usuario_id = current_user.id
         db.session.delete(current_user)
         db.session.commit()
+        invalidar_concluidos(usuario_id)
         
         logout_user()
         flash('Sua conta foi excluída com sucesso. Sentiremos sua falta!', 'success')
@@ -393,44 +380,23 @@ def delete_account():
 @login_required
 def modulos():
     # Calcular progresso para cada módulo
+    registro = obter_catalogo().modulos
+    resumo = resumo_por_modulo(current_user.id)
     modulos_com_progresso = {}
     
     for nivel, lista_modulos in MODULOS.items():
         modulos_com_progresso[nivel] = []
-        for modulo in lista_modulos:
-            # Buscar exercícios deste módulo
-            exercicios_modulo = Exercicio.query.filter_by(modulo=modulo['id']).all()
-            
-            # Verificar progresso do usuário
-            exercicios_completos = 0
-            modulo_concluido = False
-            
-            for exercicio in exercicios_modulo:
-                progresso = Progresso.query.filter_by(
-                    usuario_id=current_user.id, 
-                    exercicio_id=exercicio.id
-                ).first()
-                if progresso:
-                    exercicios_completos += 1
-            
-            # Verificar se o módulo está completo (desafio final concluído)
-            desafio_final = Exercicio.query.filter_by(
-                modulo=modulo['id'], 
-                eh_desafio_final=True
-            ).first()
-            
-            if desafio_final:
-                progresso_desafio = Progresso.query.filter_by(
-                    usuario_id=current_user.id,
-                    exercicio_id=desafio_final.id
-                ).first()
-                modulo_concluido = progresso_desafio is not None
+        for modulo_config in lista_modulos:
+            modulo = registro[modulo_config['id']]
+            dados = resumo.get(modulo['id'], {'completos': 0, 'desafio_concluido': False})
+            exercicios_completos = dados['completos']
+            total = modulo['total_exercicios']
             
             modulos_com_progresso[nivel].append({
                 **modulo,
                 'exercicios_completos': exercicios_completos,
-                'concluido': modulo_concluido,
-                'progresso_percent': int((exercicios_completos / len(exercicios_modulo)) * 100) if exercicios_modulo else 0
+                'concluido': dados['desafio_concluido'],
+                'progresso_percent': int((exercicios_completos / total) * 100) if total else 0
             })
     
     return render_template('modulos.html', 
@@ -440,37 +406,16 @@ def modulos():
 @app.route('/modulo/<string:modulo_id>')
 @login_required
 def ver_modulo(modulo_id):
-    print(f"🔍 Buscando exercícios para o módulo: {modulo_id}")
-    
-    # Buscar exercícios do módulo em ordem
-    exercicios = Exercicio.query.filter_by(modulo=modulo_id).order_by(Exercicio.ordem_no_modulo).all()
-    print(f"✅ Encontrados {len(exercicios)} exercícios para o módulo {modulo_id}")
-    
-    # Verificar progresso
-    progresso_usuario = []
-    for exercicio in exercicios:
-        progresso = Progresso.query.filter_by(
-            usuario_id=current_user.id,
-            exercicio_id=exercicio.id
-        ).first()
-        progresso_usuario.append({
-            'exercicio': exercicio,
-            'concluido': progresso is not None,
-            'tentativas': progresso.tentativas if progresso else 0
-        })
-    
     # Encontrar informações do módulo
-    modulo_info = None
-    for nivel, modulos in MODULOS.items():
-        for mod in modulos:
-            if mod['id'] == modulo_id:
-                modulo_info = mod
-                break
+    modulo_info = obter_catalogo().modulo(modulo_id)
     
     if not modulo_info:
         print(f"❌ Módulo {modulo_id} não encontrado na configuração")
         return redirect(url_for('modulos'))
     
+    # Buscar exercícios do módulo em ordem, já com o progresso do usuário
+    progresso_usuario = progresso_do_modulo(current_user.id, modulo_id)
+    
     return render_template('modulo_detalhes.html',
                          modulo=modulo_info,
                          progresso=progresso_usuario,
@@ -479,43 +424,36 @@ def ver_modulo(modulo_id):
 @app.route('/exercicios')
 @login_required
 def lista_exercicios():
-    if not current_user.is_premium_active:
-        current_user.regenerar_vidas()
-    
     tempo_restante = current_user.tempo_para_proxima_vida()
-    db.session.commit()
     
-    if current_user.vidas <= 0 and not current_user.is_premium_active:
+    if current_user.vidas_efetivas <= 0 and not current_user.is_premium_active:
         return render_template('sem_vidas.html', tempo_restante=tempo_restante)
     
     if current_user.is_premium_active:
-        exercicios = Exercicio.query.all()
+        exercicios = obter_catalogo().todos
     else:
-        exercicios = Exercicio.query.filter_by(premium=False).all()
+        exercicios = obter_catalogo().gratuitos
     
-    progresso = Progresso.query.filter_by(usuario_id=current_user.id).all()
-    exercicios_completos_ids = [p.exercicio_id for p in progresso]
+    exercicios_completos_ids = exercicios_concluidos(current_user)
     
     return render_template('lista_exercicios.html', 
                          exercicios=exercicios,
                          exercicios_completos_ids=exercicios_completos_ids,
-                         vidas=current_user.vidas,
+                         vidas=current_user.vidas_efetivas,
                          tempo_restante=tempo_restante,
                          premium=current_user.is_premium_active)
 
 @app.route('/exercicio/<int:exercicio_id>')
 @login_required
 def exercicio(exercicio_id):
-    if not current_user.is_premium_active:
-        current_user.regenerar_vidas()
-    
     tempo_restante = current_user.tempo_para_proxima_vida()
-    db.session.commit()
     
-    if current_user.vidas <= 0 and not current_user.is_premium_active:
+    if current_user.vidas_efetivas <= 0 and not current_user.is_premium_active:
         return render_template('sem_vidas.html', tempo_restante=tempo_restante)
     
-    exercicio = Exercicio.query.get_or_404(exercicio_id)
+    exercicio = obter_catalogo().get(exercicio_id)
+    if not exercicio:
+        abort(404)
     
     if exercicio.premium and not current_user.is_premium_active:
         return render_template('conteudo_premium.html')
@@ -528,16 +466,12 @@ def exercicio(exercicio_id):
 @app.route('/verificar_resposta', methods=['POST'])
 @login_required
 def verificar_resposta():
-    if not current_user.is_premium_active:
-        current_user.regenerar_vidas()
-        db.session.commit()
-    
     data = request.get_json()
     exercicio_id = data.get('exercicio_id')
     resposta_usuario = data.get('resposta')
     
-    exercicio = Exercicio.query.get(exercicio_id)
-    usuario = Usuario.query.get(current_user.id)
+    exercicio = obter_catalogo().get(exercicio_id)
+    usuario = current_user
     
     if not exercicio:
         return jsonify({'success': False, 'error': 'Exercício não encontrado'})
@@ -545,32 +479,14 @@ def verificar_resposta():
     # Simular output do terminal
     terminal_output = simular_terminal(exercicio, resposta_usuario)
     
-    progresso_existente = Progresso.query.filter_by(
-        usuario_id=usuario.id, 
-        exercicio_id=exercicio_id
-    ).first()
+    # Tudo abaixo roda numa única transação, sem ler Progresso/ModuloConcluido antes de gravar
+    premium = usuario.is_premium_active
     
     if exercicio.resposta_correta.lower() == resposta_usuario.strip().lower():
         # Resposta correta
-        if not progresso_existente:
-            progresso = Progresso(usuario_id=usuario.id, exercicio_id=exercicio_id)
-            db.session.add(progresso)
-        else:
-            progresso_existente.tentativas += 1
-        
-        # Verificar se é desafio final e marcar módulo como concluído
-        if exercicio.eh_desafio_final:
-            modulo_concluido = ModuloConcluido.query.filter_by(
-                usuario_id=usuario.id,
-                modulo=exercicio.modulo
-            ).first()
-            
-            if not modulo_concluido:
-                modulo_concluido = ModuloConcluido(
-                    usuario_id=usuario.id,
-                    modulo=exercicio.modulo
-                )
-                db.session.add(modulo_concluido)
+        novo_progresso = exercicio.id not in exercicios_concluidos(usuario)
+        vidas_restantes = usuario.estado_vidas()['vidas']
+        registrar_acerto(usuario.id, exercicio, novo_progresso)
         
         db.session.commit()
         
@@ -578,26 +494,23 @@ def verificar_resposta():
             'success': True,
             'correto': True, 
             'feedback': '🎉 Parabéns! Resposta correta!',
-            'vidas_restantes': usuario.vidas,
+            'vidas_restantes': vidas_restantes,
             'terminal_output': terminal_output,
             'eh_desafio_final': exercicio.eh_desafio_final,
             'modulo_concluido': exercicio.eh_desafio_final
         })
     else:
-        # Resposta incorreta
-        if progresso_existente:
-            progresso_existente.tentativas += 1
+        # Resposta incorreta: exercício já concluído só soma tentativa, senão gasta vida
+        if registrar_tentativa_errada(usuario.id, exercicio.id):
+            vidas = usuario.estado_vidas()['vidas']
+            vidas_compradas, vidas_utilizadas_compradas = usuario.vidas_compradas, usuario.vidas_utilizadas_compradas
         else:
-            # Usar vida
-            if usuario.vidas_compradas > usuario.vidas_utilizadas_compradas:
-                usuario.usar_vida_comprada()
-            else:
-                if not usuario.is_premium_active:
-                    usuario.vidas -= 1
+            vidas, vidas_compradas, vidas_utilizadas_compradas = usuario.consumir_vida()
         
         db.session.commit()
         
-        if usuario.vidas <= 0 and not usuario.is_premium_active and usuario.get_vidas_compradas_nao_utilizadas() <= 0:
+        vidas_compradas_restantes = max(0, (vidas_compradas or 0) - (vidas_utilizadas_compradas or 0))
+        if vidas <= 0 and not premium and vidas_compradas_restantes <= 0:
             return jsonify({
                 'success': True,
                 'correto': False, 
@@ -608,15 +521,15 @@ def verificar_resposta():
             })
         else:
             feedback = '❌ Resposta incorreta. Tente novamente!'
-            if not usuario.is_premium_active:
-                feedback += f' Vidas restantes: {usuario.vidas}'
+            if not premium:
+                feedback += f' Vidas restantes: {vidas}'
             else:
                 feedback += ' (Premium: vidas infinitas!)'
                 
             return jsonify({
                 'success': True,
                 'correto': False, 
-                'vidas_restantes': usuario.vidas,
+                'vidas_restantes': vidas,
                 'feedback': feedback,
                 'terminal_output': terminal_output,
                 'dica': exercicio.dica if exercicio.dica else None
@@ -652,16 +565,14 @@ def simular_terminal(exercicio, resposta):
 @app.route('/proximo_exercicio/<int:exercicio_atual_id>')
 @login_required
 def proximo_exercicio(exercicio_atual_id):
-    exercicio_atual = Exercicio.query.get(exercicio_atual_id)
+    catalogo = obter_catalogo()
+    exercicio_atual = catalogo.get(exercicio_atual_id)
     
     if not exercicio_atual:
         return redirect(url_for('modulos'))
     
-    # Buscar próximo exercício no mesmo módulo
-    proximo = Exercicio.query.filter(
-        Exercicio.modulo == exercicio_atual.modulo,
-        Exercicio.ordem_no_modulo > exercicio_atual.ordem_no_modulo
-    ).order_by(Exercicio.ordem_no_modulo).first()
+    # Próximo exercício pela tabela pré-calculada (segue para o módulo seguinte no fim do atual)
+    proximo = catalogo.proximo_de(exercicio_atual.id)
     
     if proximo:
         if proximo.premium and not current_user.is_premium_active:
@@ -679,38 +590,25 @@ def proximo_exercicio(exercicio_atual_id):
             # Se não há módulo definido, redirecionar para módulos
             return redirect(url_for('modulos'))
 
-@app.route('/atualizar_tempo_restante')
+@app.route('/eventos/vidas')
 @login_required
-def atualizar_tempo_restante():
-    try:
-        if not current_user.is_premium_active:
-            current_user.regenerar_vidas()
-            tempo_restante = current_user.tempo_para_proxima_vida()
-        else:
-            tempo_restante = 0
-        
-        db.session.commit()
-        
-        return jsonify({
-            'vidas': current_user.vidas,
-            'tempo_restante': tempo_restante,
-            'tempo_formatado': formatar_tempo(tempo_restante) if tempo_restante > 0 else "Pronta!",
-            'premium': current_user.is_premium_active
-        })
-    except Exception as e:
-        print(f"❌ Erro em atualizar_tempo_restante: {str(e)}")
-        # Retorna valores padrão em caso de erro
-        return jsonify({
-            'vidas': current_user.vidas,
-            'tempo_restante': 0,
-            'tempo_formatado': "Erro",
-            'premium': current_user.is_premium_active
-        })
+def eventos_vidas():
+    """Polling curto no formato SSE, não push: cada requisição responde na hora e encerra.
 
-def formatar_tempo(segundos):
-    minutos = segundos // 60
-    segundos_rest = segundos % 60
-    return f"{minutos:02d}:{segundos_rest:02d}"
+    O servidor não avisa mudanças; o navegador só as vê na próxima consulta, que o
+    EventSource faz sozinho a cada `retry` (VIDAS_STREAM_RECONEXAO, 15 s) mandando a
+    última versão recebida em Last-Event-ID. O evento só é enviado se o estado lido
+    da linha do usuário tiver outra versão. A página também reconsulta no prazo da
+    próxima vida e ao voltar a ficar visível.
+    """
+    estado = serializar_estado(current_user.estado_vidas())
+    versao = versao_estado(estado)
+    retry_ms = VIDAS_STREAM_RECONEXAO * 1000
+    if request.headers.get('Last-Event-ID') == versao:
+        mensagem = f"retry: {retry_ms}\n\n"
+    else:
+        mensagem = formatar_evento('estado', estado, retry_ms=retry_ms, id_evento=versao)
+    return Response(mensagem, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/loja')
 @login_required
@@ -723,6 +621,47 @@ def loja():
                          status_reembolso=status_reembolso,
                          stripe_public_key=STRIPE_PUBLIC_KEY)
 
+def checkout_aberto(usuario_id, tipo):
+    """Sessão de checkout pendente e ainda utilizável para o mesmo usuário e produto"""
+    return Transacao.query.filter(
+        Transacao.usuario_id == usuario_id,
+        Transacao.tipo == tipo,
+        Transacao.status == 'pendente',
+        Transacao.stripe_checkout_url.isnot(None),
+        # Margem para o usuário ainda conseguir pagar antes de a sessão expirar
+        Transacao.checkout_expira_em > datetime.utcnow() + timedelta(minutes=5)
+    ).order_by(Transacao.id.desc()).first()
+
+def criar_checkout(usuario_id, tipo, price_id, **parametros):
+    """Cria a sessão na Stripe com chave de idempotência; cliques simultâneos recebem a mesma sessão"""
+    # Chave e expiração derivam da mesma janela para que os parâmetros repetidos sejam idênticos
+    janela = int(time.time()) // CHECKOUT_JANELA_IDEMPOTENCIA * CHECKOUT_JANELA_IDEMPOTENCIA
+    expira_em = janela + CHECKOUT_VALIDADE
+    checkout_session = executor_stripe.chamar(
+        stripe.checkout.Session.create,
+        idempotency_key=f"checkout-{usuario_id}-{tipo}-{price_id}-{janela}",
+        expires_at=expira_em,
+        **parametros
+    )
+    return checkout_session, datetime.utcfromtimestamp(expira_em)
+
+def registrar_transacao_checkout(checkout_session, expira_em, **campos):
+    """Grava a transação pendente da sessão; cliques simultâneos com a mesma sessão gravam uma só"""
+    # ON CONFLICT: o índice único em stripe_session_id decide, sem consulta prévia
+    db.session.execute(
+        insert_com_conflito(Transacao)
+        .values(
+            status='pendente',
+            stripe_session_id=checkout_session.id,
+            stripe_checkout_url=checkout_session.get('url'),
+            checkout_expira_em=expira_em,
+            id_publico=Transacao().gerar_id_publico(),
+            **campos
+        )
+        .on_conflict_do_nothing(index_elements=['stripe_session_id'])
+    )
+    db.session.commit()
+
 @app.route('/criar-sessao-assinatura', methods=['POST'])
 @login_required
 def criar_sessao_assinatura():
@@ -736,16 +675,24 @@ def criar_sessao_assinatura():
             print("❌ STRIPE_PRICE_ASSINATURA não configurado")
             return jsonify({'error': 'Configuração de preço não encontrada'}), 500
         
+        aberto = checkout_aberto(current_user.id, 'assinatura')
+        if aberto:
+            print(f"♻️ Reaproveitando sessão de assinatura pendente: {aberto.stripe_session_id}")
+            return jsonify({'checkout_url': aberto.stripe_checkout_url})
+        
         print(f"🔄 Criando sessão de assinatura com price_id: {price_id}")
         
         try:
-            price = stripe.Price.retrieve(price_id)
+            price = cache_precos.obter('assinatura')
             print(f"✅ Preço encontrado: {price.id} - {price.unit_amount} {price.currency}")
+        except (StripeOcupado, StripeTimeout):
+            raise
         except Exception as price_error:
             print(f"❌ Erro ao verificar preço: {str(price_error)}")
             return jsonify({'error': 'Preço não encontrado no Stripe'}), 500
         
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session, expira_em = criar_checkout(
+            current_user.id, 'assinatura', price_id,
             payment_method_types=['card'],
             line_items=[{
                 'price': price_id,
@@ -761,22 +708,23 @@ def criar_sessao_assinatura():
             }
         )
         
-        transacao = Transacao(
+        # Outro clique pode ter recebido esta mesma sessão da Stripe: só uma transação é gravada
+        registrar_transacao_checkout(
+            checkout_session, expira_em,
             usuario_id=current_user.id,
             tipo='assinatura',
             valor=13.49,
             detalhes='Assinatura Premium - Aguardando confirmação do pagamento',
-            status='pendente',
-            stripe_session_id=checkout_session.id,
-            id_publico=Transacao().gerar_id_publico(),
             quantidade_produto=1  # Uma assinatura
         )
-        db.session.add(transacao)
-        db.session.commit()
         
         print(f"✅ Sessão de assinatura criada: {checkout_session.url}")
         return jsonify({'checkout_url': checkout_session.url})
         
+    except (StripeOcupado, StripeTimeout) as e:
+        print(f"⏳ Stripe indisponível ao criar sessão de assinatura: {str(e)}")
+        return jsonify({'error': 'Pagamentos temporariamente sobrecarregados. Tente novamente em instantes.'}), 503
+        
     except Exception as e:
         print(f"❌ Erro ao criar sessão de assinatura: {str(e)}")
         import traceback
@@ -803,11 +751,18 @@ def criar_sessao_vidas(quantidade):
             print(f"❌ STRIPE_PRICE_VIDA_{quantidade} não configurado")
             return jsonify({'error': 'Configuração de preço não encontrada'}), 500
         
+        aberto = checkout_aberto(current_user.id, f'vidas_{quantidade}')
+        if aberto:
+            print(f"♻️ Reaproveitando sessão de vidas pendente: {aberto.stripe_session_id}")
+            return jsonify({'checkout_url': aberto.stripe_checkout_url})
+        
         print(f"🔄 Criando sessão de vidas com price_id: {price_id}, quantidade: {quantidade}")
         
         try:
-            price = stripe.Price.retrieve(price_id)
+            price = cache_precos.obter(f'vida_{quantidade}')
             print(f"✅ Preço encontrado: {price.id} - {price.unit_amount} {price.currency}")
+        except (StripeOcupado, StripeTimeout):
+            raise
         except Exception as price_error:
             print(f"❌ Erro ao verificar preço: {str(price_error)}")
             return jsonify({'error': 'Preço não encontrado no Stripe'}), 500
@@ -817,7 +772,8 @@ def criar_sessao_vidas(quantidade):
         
         print(f"🔗 URLs: success={success_url}, cancel={cancel_url}")
         
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session, expira_em = criar_checkout(
+            current_user.id, f'vidas_{quantidade}', price_id,
             payment_method_types=['card'],
             line_items=[{
                 'price': price_id,
@@ -837,22 +793,22 @@ def criar_sessao_vidas(quantidade):
         valores = {1: 0.99, 3: 3.00, 5: 4.75}
         valor = valores[quantidade]
         
-        transacao = Transacao(
+        registrar_transacao_checkout(
+            checkout_session, expira_em,
             usuario_id=current_user.id,
             tipo=f'vidas_{quantidade}',
             valor=valor,
             detalhes=f'Pacote de {quantidade} vidas - Aguardando confirmação do pagamento',
-            status='pendente',
-            stripe_session_id=checkout_session.id,
-            id_publico=Transacao().gerar_id_publico(),
             quantidade_produto=quantidade
         )
-        db.session.add(transacao)
-        db.session.commit()
         
         print(f"✅ Sessão de vidas criada com sucesso: {checkout_session.url}")
         return jsonify({'checkout_url': checkout_session.url})
         
+    except (StripeOcupado, StripeTimeout) as e:
+        print(f"⏳ Stripe indisponível ao criar sessão de vidas: {str(e)}")
+        return jsonify({'error': 'Pagamentos temporariamente sobrecarregados. Tente novamente em instantes.'}), 503
+        
     except Exception as e:
         print(f"❌ Erro ao criar sessão de vidas: {str(e)}")
         import traceback
@@ -879,8 +835,21 @@ def stripe_webhook():
         print(f"❌ Erro na assinatura do webhook: {e}")
         return 'Assinatura inválida', 400
 
-    print(f"✅ Webhook recebido: {event['type']}")
+    # Só grava na caixa de entrada; o worker de tarefas.py aplica o evento depois
+    try:
+        novo = registrar_evento(event, payload)
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro ao gravar webhook {event['id']}: {str(e)}")
+        return 'Erro ao registrar evento', 500
+
+    print(f"✅ Webhook recebido: {event['type']} ({event['id']}){'' if novo else ' - duplicado, ignorado'}")
+    return jsonify({'status': 'success'})
 
+def despachar_evento_stripe(dados):
+    """Aplica um evento da caixa de entrada; exceções fazem o evento ser reprocessado"""
+    event = stripe.Event.construct_from(dados, stripe.api_key)
+    
     if event['type'] == 'checkout.session.completed':
         session = event['data']['object']
         processar_pagamento_sucesso(session)
@@ -893,8 +862,6 @@ def stripe_webhook():
         refund = event['data']['object']
         processar_reembolso_stripe(refund)
 
-    return jsonify({'status': 'success'})
-
 def processar_pagamento_sucesso(session):
     try:
         user_id = session['metadata']['user_id']
@@ -908,11 +875,37 @@ def processar_pagamento_sucesso(session):
         print(f"✅ Processando pagamento para usuário: {usuario.username}, tipo: {tipo}")
         
         transacao = Transacao.query.filter_by(stripe_session_id=session.id).first()
-        if transacao:
-            transacao.status = 'confirmada'
-            transacao.stripe_payment_intent = session.payment_intent
-            transacao.detalhes = transacao.detalhes.replace('Aguardando confirmação do pagamento', 'Pagamento confirmado')
-            print(f"✅ Transação atualizada: {transacao.id}")
+        if not transacao:
+            # Sessão sem transação local: grava a linha antes de conceder algo, para o
+            # compare-and-set abaixo também valer num replay
+            quantidade = int(session['metadata'].get('quantidade') or 1)
+            registrar_transacao_checkout(
+                session, None,
+                usuario_id=usuario.id,
+                tipo='assinatura' if tipo == 'assinatura' else f'vidas_{quantidade}',
+                valor=(session.get('amount_total') or 0) / 100,
+                detalhes=('Assinatura Premium' if tipo == 'assinatura' else f'Pacote de {quantidade} vidas')
+                         + ' - Aguardando confirmação do pagamento',
+                quantidade_produto=quantidade
+            )
+            transacao = Transacao.query.filter_by(stripe_session_id=session.id).first()
+        
+        # Confirma com compare-and-set: webhook e verificação da página podem chegar juntos.
+        # Só pendente/expirada viram confirmada; reembolsada ou já confirmada = evento já aplicado
+        confirmou = Transacao.query.filter(
+            Transacao.id == transacao.id,
+            Transacao.status.in_(('pendente', 'expirada'))
+        ).update({Transacao.status: 'confirmada'}, synchronize_session=False)
+        if not confirmou:
+            # Evento repetido (replay ou retentativa) ou já aplicado por outra requisição
+            db.session.rollback()
+            print(f"ℹ️ Pagamento da sessão {session.id} já processado")
+            return
+        
+        transacao.status = 'confirmada'
+        transacao.stripe_payment_intent = session.payment_intent
+        transacao.detalhes = transacao.detalhes.replace('Aguardando confirmação do pagamento', 'Pagamento confirmado')
+        print(f"✅ Transação atualizada: {transacao.id}")
         
         if tipo == 'assinatura':
             data_inicio = datetime.utcnow()
@@ -926,6 +919,7 @@ def processar_pagamento_sucesso(session):
             
         elif tipo == 'vidas':
             quantidade = int(session['metadata']['quantidade'])
+            usuario.regenerar_vidas()
             usuario.vidas += quantidade
             usuario.adicionar_vidas_compradas(quantidade)
             print(f"✅ {quantidade} vidas adicionadas para usuário: {usuario.username}")
@@ -936,6 +930,7 @@ def processar_pagamento_sucesso(session):
     except Exception as e:
         print(f"❌ Erro ao processar pagamento: {str(e)}")
         db.session.rollback()
+        raise
 
 def processar_cancelamento_assinatura(subscription):
     print(f"📝 Assinatura cancelada: {subscription.id}")
@@ -952,6 +947,11 @@ def processar_reembolso_stripe(refund):
             print(f"❌ Transação não encontrada para payment_intent: {payment_intent}")
             return
         
+        if transacao.status_reembolso == 'completado':
+            # Já concluído pela tarefa reconciliar-reembolsos ou por um evento anterior
+            print(f"ℹ️ Reembolso da transação {transacao.id_publico} já concluído")
+            return
+        
         if refund.status == 'succeeded':
             # Reembolso bem-sucedido
             transacao.completar_reembolso({
@@ -959,22 +959,23 @@ def processar_reembolso_stripe(refund):
                 'amount': refund.amount / 100,
                 'currency': refund.currency,
                 'status': refund.status,
-                'reason': refund.reason
+                'reason': refund.get('reason')
             })
             
             print(f"✅ Reembolso processado com sucesso: {refund.id}")
             
         elif refund.status == 'failed':
             # Reembolso falhou
-            transacao.falhar_reembolso(f"Reembolso falhou na Stripe: {refund.failure_reason}")
+            transacao.falhar_reembolso(f"Reembolso falhou na Stripe: {refund.get('failure_reason')}")
             
-            print(f"❌ Reembolso falhou: {refund.id} - {refund.failure_reason}")
+            print(f"❌ Reembolso falhou: {refund.id} - {refund.get('failure_reason')}")
         
         db.session.commit()
         
     except Exception as e:
         print(f"❌ Erro ao processar reembolso: {str(e)}")
         db.session.rollback()
+        raise
 
 @app.route('/pagamento-sucesso')
 @login_required
@@ -997,16 +998,44 @@ def pagamento_sucesso():
                              tipo=tipo,
                              quantidade=quantidade,
                              transacao=transacao)
-    else:
-        try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            if session.payment_status == 'paid':
-                processar_pagamento_sucesso(session)
-                return redirect(url_for('pagamento_sucesso', session_id=session_id, tipo=tipo, quantidade=quantidade))
-        except Exception as e:
-            print(f"Erro ao verificar sessão: {str(e)}")
-        
-        return render_template('pagamento_processando.html')
+    
+    return render_template('pagamento_processando.html', session_id=session_id)
+
+def verificar_sessao_pendente(transacao):
+    """Consulta a Stripe por uma sessão ainda pendente, no máximo uma vez por intervalo entre todos os workers"""
+    agora = datetime.utcnow()
+    limite = agora - timedelta(seconds=PAGAMENTO_VERIFICACAO_INTERVALO)
+    # Só quem ganhar esta reserva consulta a Stripe; os demais respondem com o status local
+    reservou = Transacao.query.filter(
+        Transacao.id == transacao.id,
+        Transacao.status == 'pendente',
+        db.or_(Transacao.verificado_stripe_em.is_(None), Transacao.verificado_stripe_em < limite)
+    ).update({Transacao.verificado_stripe_em: agora}, synchronize_session=False)
+    db.session.commit()
+    if not reservou:
+        return
+    
+    try:
+        session = executor_stripe.chamar(stripe.checkout.Session.retrieve, transacao.stripe_session_id)
+        if session.payment_status == 'paid':
+            processar_pagamento_sucesso(session)
+    except Exception as e:
+        print(f"Erro ao verificar sessão: {str(e)}")
+
+@app.route('/pagamento-status')
+@login_required
+def pagamento_status():
+    session_id = request.args.get('session_id')
+    transacao = Transacao.query.filter_by(stripe_session_id=session_id, usuario_id=current_user.id).first()
+    if not transacao:
+        return jsonify({'status': 'nao_encontrada'}), 404
+    
+    if transacao.status == 'pendente':
+        # O webhook ainda não chegou
+        verificar_sessao_pendente(transacao)
+        db.session.refresh(transacao)
+    
+    return jsonify({'status': transacao.status})
 
 @app.route('/conteudo_premium')
 @login_required
@@ -1014,14 +1043,30 @@ def conteudo_premium():
     if not current_user.is_premium_active:
         return render_template('conteudo_premium.html')
     
-    exercicios_premium = Exercicio.query.filter_by(premium=True).all()
-    progresso = Progresso.query.filter_by(usuario_id=current_user.id).all()
-    exercicios_completos_ids = [p.exercicio_id for p in progresso]
+    exercicios_premium = obter_catalogo().premium
+    exercicios_completos_ids = exercicios_concluidos(current_user)
     
     return render_template('conteudo_premium_exclusivo.html', 
                          exercicios=exercicios_premium,
                          exercicios_completos_ids=exercicios_completos_ids)
 
+def parametros_reembolso(transacao):
+    """Parâmetros do Refund.create; iguais em toda retentativa, como a Idempotency-Key exige"""
+    parametros = {
+        'payment_intent': transacao.stripe_payment_intent,
+        'idempotency_key': f'refund-{transacao.id_publico}',
+        'metadata': {
+            'user_id': transacao.usuario_id,
+            'transacao_id': transacao.id_publico,
+            'motivo': transacao.motivo_reembolso
+        }
+    }
+    if transacao.tipo.startswith('vidas_'):
+        # Reembolso parcial: só as vidas não utilizadas
+        parametros['amount'] = int(transacao.valor_reembolsado * 100)
+        parametros['metadata']['tipo'] = 'reembolso_parcial_vidas'
+    return parametros
+
 @app.route('/cancelar_assinatura', methods=['POST'])
 @login_required
 def cancelar_assinatura():
@@ -1048,33 +1093,26 @@ def cancelar_assinatura():
             transacao.solicitar_reembolso(motivo)
             
             try:
-                reembolso = stripe.Refund.create(
-                    payment_intent=transacao.stripe_payment_intent,
-                    metadata={
-                        'user_id': current_user.id,
-                        'transacao_id': transacao.id_publico,
-                        'motivo': motivo
-                    }
-                )
-                
+                reembolso = executor_stripe.chamar(stripe.Refund.create, **parametros_reembolso(transacao))
                 transacao.processar_reembolso(reembolso.id)
-                
-                # REMOÇÃO IMEDIATA DO STATUS PREMIUM - CONFORME CDC
-                current_user.premium = False
-                current_user.premium_cancelado = True
-                current_user.data_inicio_premium = None
-                current_user.data_expiracao_premium = None
-                
                 mensagem = f'Assinatura cancelada com sucesso! Reembolso integral de R$ {transacao.valor_reembolsado:.2f} solicitado. ID do Reembolso: {reembolso.id}'
                 
+            except StripeTimeout as stripe_error:
+                # Sem resposta não dá para saber se o refund foi criado: a reconciliação decide, nunca um segundo pedido
+                transacao.aguardar_reembolso(stripe_error)
+                mensagem = f'Assinatura cancelada! O reembolso de R$ {transacao.valor_reembolsado:.2f} está em processamento e será confirmado em breve.'
+                
+            except StripeOcupado:
+                raise
             except Exception as stripe_error:
                 transacao.falhar_reembolso(str(stripe_error))
-                # MESMO COM ERRO NO REEMBOLSO, REMOVEMOS O PREMIUM IMEDIATAMENTE
-                current_user.premium = False
-                current_user.premium_cancelado = True
-                current_user.data_inicio_premium = None
-                current_user.data_expiracao_premium = None
                 mensagem = f'Assinatura cancelada, mas houve um erro ao processar o reembolso: {str(stripe_error)}. O status premium foi removido conforme CDC.'
+            
+            # REMOÇÃO IMEDIATA DO STATUS PREMIUM - CONFORME CDC (mesmo com erro no reembolso)
+            current_user.premium = False
+            current_user.premium_cancelado = True
+            current_user.data_inicio_premium = None
+            current_user.data_expiracao_premium = None
                 
         else:
             # CANCELAMENTO FORA DO PRAZO DE REEMBOLSO
@@ -1094,6 +1132,10 @@ def cancelar_assinatura():
             'valor_reembolsado': transacao.valor_reembolsado if pode_reembolso else 0
         })
         
+    except StripeOcupado:
+        # A chamada nem saiu: nada foi criado na Stripe nem cancelado aqui, e o usuário pode tentar de novo
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Pagamentos temporariamente indisponíveis, tente novamente em instantes.'}), 503
     except Exception as e:
         print(f"❌ Erro ao cancelar assinatura: {str(e)}")
         db.session.rollback()
@@ -1123,24 +1165,20 @@ def solicitar_reembolso_vidas(id_publico):
         transacao.solicitar_reembolso(motivo)
         
         if transacao.stripe_payment_intent:
-            # Para reembolsos parciais, precisamos calcular o valor
-            valor_reembolso_centavos = int(transacao.valor_reembolsado * 100)
-            
-            reembolso = stripe.Refund.create(
-                payment_intent=transacao.stripe_payment_intent,
-                amount=valor_reembolso_centavos,
-                metadata={
-                    'user_id': current_user.id,
-                    'transacao_id': transacao.id_publico,
-                    'motivo': motivo,
-                    'tipo': 'reembolso_parcial_vidas'
-                }
-            )
-            
-            transacao.processar_reembolso(reembolso.id)
+            try:
+                reembolso = executor_stripe.chamar(stripe.Refund.create, **parametros_reembolso(transacao))
+                transacao.processar_reembolso(reembolso.id)
+                refund_id = reembolso.id
+                mensagem = f'Reembolso parcial de R$ {transacao.valor_reembolsado:.2f} solicitado com sucesso!'
+            except StripeTimeout as e:
+                # Sem resposta não dá para saber se o refund foi criado: a reconciliação decide, nunca um segundo pedido
+                transacao.aguardar_reembolso(e)
+                refund_id = None
+                mensagem = f'Reembolso parcial de R$ {transacao.valor_reembolsado:.2f} em processamento, será confirmado em breve.'
             
             # Remover vidas não utilizadas da conta do usuário
             vidas_remover = transacao.quantidade_produto - transacao.quantidade_utilizada
+            current_user.regenerar_vidas()
             current_user.vidas = max(0, current_user.vidas - vidas_remover)
             current_user.vidas_compradas = max(0, current_user.vidas_compradas - vidas_remover)
             
@@ -1148,15 +1186,19 @@ def solicitar_reembolso_vidas(id_publico):
             
             return jsonify({
                 'success': True,
-                'message': f'Reembolso parcial de R$ {transacao.valor_reembolsado:.2f} solicitado com sucesso!',
-                'refund_id': reembolso.id,
+                'message': mensagem,
+                'refund_id': refund_id,
                 'status_reembolso': transacao.status_reembolso,
                 'valor_reembolsado': transacao.valor_reembolsado,
                 'vidas_nao_utilizadas': vidas_remover
             })
         else:
             return jsonify({'success': False, 'error': 'Não foi possível processar o reembolso. Payment intent não encontrado.'})
-            
+    
+    except StripeOcupado:
+        # A chamada nem saiu: nada foi criado na Stripe e o usuário pode tentar de novo
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Pagamentos temporariamente indisponíveis, tente novamente em instantes.'}), 503
     except Exception as e:
         transacao.falhar_reembolso(str(e))
         db.session.commit()
@@ -1165,7 +1207,10 @@ def solicitar_reembolso_vidas(id_publico):
 @app.route('/minhas-compras')
 @login_required
 def minhas_compras():
-    transacoes = Transacao.query.filter_by(usuario_id=current_user.id).order_by(Transacao.data_transacao.desc()).all()
+    transacoes = Transacao.query.filter(
+        Transacao.usuario_id == current_user.id,
+        Transacao.status.in_(STATUS_TRANSACAO_VISIVEIS)
+    ).order_by(Transacao.data_transacao.desc()).all()
     return render_template('minhas_compras.html', transacoes=transacoes)
 
 @app.route('/detalhes-transacao/<string:id_publico>')
@@ -1173,27 +1218,7 @@ def minhas_compras():
 def detalhes_transacao(id_publico):
     transacao = Transacao.query.filter_by(id_publico=id_publico, usuario_id=current_user.id).first_or_404()
     
-    # Buscar informações atualizadas do reembolso na Stripe se aplicável
-    if transacao.stripe_refund_id and transacao.status_reembolso in ['processando', 'solicitado']:
-        try:
-            refund = stripe.Refund.retrieve(transacao.stripe_refund_id)
-            
-            if refund.status == 'succeeded' and transacao.status_reembolso != 'completado':
-                transacao.completar_reembolso({
-                    'refund_id': refund.id,
-                    'amount': refund.amount / 100,
-                    'currency': refund.currency,
-                    'status': refund.status
-                })
-                db.session.commit()
-                
-            elif refund.status == 'failed' and transacao.status_reembolso != 'falhou':
-                transacao.falhar_reembolso(f"Reembolso falhou na Stripe: {refund.failure_reason}")
-                db.session.commit()
-                
-        except Exception as e:
-            print(f"Erro ao buscar status do reembolso: {str(e)}")
-    
+    # Status do reembolso vem do webhook e da tarefa reconciliar-reembolsos; a página só lê o banco
     return render_template('detalhes_transacao.html', transacao=transacao)
 
 @app.route('/termos-uso')
@@ -1211,7 +1236,8 @@ def termo_arrependimento():
 @app.route('/comecar_agora')
 @login_required
 def comecar_agora():
-    primeiro_exercicio = Exercicio.query.filter_by(premium=False).order_by(Exercicio.id).first()
+    gratuitos = obter_catalogo().gratuitos
+    primeiro_exercicio = gratuitos[0] if gratuitos else None
     if primeiro_exercicio:
         return redirect(url_for('exercicio', exercicio_id=primeiro_exercicio.id))
     else:
@@ -1235,6 +1261,32 @@ def db_status():
         <p><strong>Status:</strong> Ainda usando SQLite em produção</p>
         """
 
+@app.route('/pronto')
+def pronto():
+    """Readiness: worker aquecido, banco respondendo e schema na versão que este código espera"""
+    from migracoes import versao_do_schema, VERSAO_ATUAL
+    estado = dict(prontidao)
+    try:
+        estado['schema'] = versao_do_schema()
+        estado['banco'] = 'ok'
+        pronto = prontidao['pronto'] and estado['schema'] >= VERSAO_ATUAL
+    except Exception as e:
+        db.session.rollback()
+        estado['banco'] = f'erro: {str(e)}'
+        pronto = False
+    estado['pronto'] = pronto
+    return jsonify(estado), 200 if pronto else 503
+
+@app.route('/stripe-status')
+def stripe_status():
+    # Métricas internas: só com o token de monitoramento (sem STATUS_TOKEN configurado, a rota não existe)
+    token = os.environ.get('STATUS_TOKEN')
+    enviado = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not token or not hmac.compare_digest(enviado.encode(), token.encode()):
+        abort(404)
+    return jsonify({**executor_stripe.metricas(), 'pool_http': stripe.estatisticas_pool(),
+                    'sdk_carregado': stripe.carregado})
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
@@ -1245,20 +1297,9 @@ def internal_error(error):
     return render_template('500.html'), 500
 
 if __name__ == '__main__':
-    # Inicialização síncrona do banco de dados
-    with app.app_context():
-        try:
-            db.create_all()
-            print("✅ Tabelas do banco criadas/verificadas")
-            
-            # Criar dados iniciais de forma síncrona
-            if not Exercicio.query.first():
-                criar_dados_iniciais()
-                print("✅ Dados iniciais criados com sucesso!")
-        except Exception as e:
-            print(f"❌ Erro na inicialização do banco: {str(e)}")
-            db.session.rollback()
+    # Servidor de desenvolvimento: aplica o mesmo passo de release que o init_db.py
+    init_database()
     
-    port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    # e sobe pelo wsgi, como o gunicorn: schema conferido, worker aquecido (preparar_worker) e /pronto em 200
+    import runpy
+    runpy.run_module('wsgi', run_name='__main__')
@@ -0,0 +1,80 @@
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from models import db
+
+# Desliga o aquecimento (útil para comparar a latência das primeiras requisições)
+AQUECIMENTO_ATIVO = os.environ.get('AQUECIMENTO', '1') != '0'
+# Conexões abertas no pool de cada worker antes de aceitar tráfego (padrão: uma por thread)
+AQUECIMENTO_CONEXOES = int(os.environ.get('AQUECIMENTO_CONEXOES', 0))
+
+
+def _medir(etapas, nome, funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    etapas[nome] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado
+
+
+def compilar_templates(app):
+    """Compila todos os templates para o cache do Jinja; devolve quantos foram compilados"""
+    nomes = app.jinja_env.list_templates()
+    for nome in nomes:
+        app.jinja_env.get_template(nome)
+    return len(nomes)
+
+
+def abrir_conexoes(quantidade):
+    """Abre `quantidade` conexões ao mesmo tempo e as devolve ao pool, já estabelecidas"""
+    pool = db.engine.pool
+    if hasattr(pool, 'size'):
+        quantidade = min(quantidade, pool.size())
+    conexoes = []
+    try:
+        for _ in range(max(1, quantidade)):
+            conexao = db.engine.connect()
+            conexoes.append(conexao)
+            conexao.execute(text('SELECT 1'))
+    finally:
+        for conexao in conexoes:
+            conexao.close()
+    return len(conexoes)
+
+
+def aquecer_aplicacao(app):
+    """Parte compartilhável do aquecimento: com preload roda uma vez no master e os workers herdam"""
+    from catalogo import carregar_catalogo
+
+    etapas = {}
+    if not AQUECIMENTO_ATIVO:
+        _medir(etapas, 'catalogo', carregar_catalogo)
+        return etapas
+    _medir(etapas, 'mappers', configure_mappers)
+    _medir(etapas, 'rotas', app.url_map.update)
+    _medir(etapas, 'templates', compilar_templates, app)
+    _medir(etapas, 'catalogo', carregar_catalogo)
+    return etapas
+
+
+def aquecer_worker(app, conexoes=1):
+    """Parte de cada processo: conexões do pool e chaves da sessão.
+
+    SDK e preços da Stripe não entram aqui: o primeiro cache_precos.obter() do
+    processo inicia o refresh em segundo plano.
+    """
+    from app import chaveiro_sessao
+
+    etapas = {}
+    if not AQUECIMENTO_ATIVO:
+        return etapas
+    with app.app_context():
+        _medir(etapas, 'conexoes', abrir_conexoes, AQUECIMENTO_CONEXOES or conexoes)
+        _medir(etapas, 'chaves_sessao', chaveiro_sessao.obter)
+    return etapas
+
+
+def formatar_etapas(etapas):
+    return ', '.join(f"{nome} {ms:.0f} ms" for nome, ms in etapas.items())
@@ -0,0 +1,163 @@
+"""Compara throughput, latência e memória do gunicorn em diferentes perfis de worker.
+
+Cada perfil sobe o gunicorn_config.py com variáveis de ambiente diferentes sobre um
+banco SQLite temporário e recebe a mesma carga de páginas de leitura autenticadas.
+
+Uso: python benchmark_gunicorn.py [--duracao 15] [--clientes 16] [--perfis original sync gthread]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+# Ambiente de cada perfil; "original" reproduz a configuração anterior (1 worker, 2 threads, sem preload)
+PERFIS = {
+    'original': {'GUNICORN_PERFIL': 'gthread', 'WEB_CONCURRENCY': '1', 'GUNICORN_THREADS': '2', 'GUNICORN_PRELOAD': '0'},
+    'sync': {'GUNICORN_PERFIL': 'sync'},
+    'gthread': {'GUNICORN_PERFIL': 'gthread'},
+    'gthread-sem-preload': {'GUNICORN_PERFIL': 'gthread', 'GUNICORN_PRELOAD': '0'},
+}
+
+PAGINAS = ['/modulos', '/modulo/variaveis_operadores', '/exercicio/1', '/dashboard', '/exercicios']
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def filhos(pid):
+    """PIDs dos workers (processos filhos do master)"""
+    encontrados = []
+    for entrada in os.listdir('/proc'):
+        if entrada.isdigit():
+            try:
+                with open(f'/proc/{entrada}/stat') as arquivo:
+                    if int(arquivo.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        encontrados.append(int(entrada))
+            except (OSError, IndexError, ValueError):
+                pass
+    return encontrados
+
+
+def memoria_kb(pid):
+    """(Pss, Private) do processo: Pss divide as páginas compartilhadas entre quem as usa"""
+    dados = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as arquivo:
+            for linha in arquivo:
+                partes = linha.split()
+                if partes[0] in ('Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                    dados[partes[0]] = int(partes[1])
+    except OSError:
+        return 0, 0
+    return dados.get('Pss:', 0), dados.get('Private_Clean:', 0) + dados.get('Private_Dirty:', 0)
+
+
+def esperar_pronto(base, processo, limite=60):
+    fim = time.time() + limite
+    while time.time() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError('gunicorn encerrou antes de ficar pronto')
+        try:
+            if requests.get(base + '/login', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError('gunicorn não respondeu a tempo')
+
+
+def gerar_carga(base, clientes, duracao):
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    fim = time.time() + duracao
+
+    def cliente(indice):
+        sessao = requests.Session()
+        sessao.post(base + '/login', data={'email': 'bench@codignarte.test', 'senha': 'bench'})
+        i = indice
+        while time.time() < fim:
+            inicio = time.perf_counter()
+            try:
+                ok = sessao.get(base + PAGINAS[i % len(PAGINAS)], timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    latencias.append(time.perf_counter() - inicio)
+                else:
+                    erros[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencias), erros[0]
+
+
+def medir_perfil(nome, banco, clientes, duracao):
+    porta = porta_livre()
+    base = f'http://127.0.0.1:{porta}'
+    ambiente = {**os.environ, **PERFIS[nome], 'PORT': str(porta), 'DATABASE_URL': f'sqlite:///{banco}',
+                'SECRET_KEY': 'benchmark'}
+    processo = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', 'wsgi:application'],
+                                env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        esperar_pronto(base, processo)
+        requests.post(base + '/cadastro', data={'username': 'bench', 'email': 'bench@codignarte.test',
+                                                'senha': 'bench', 'aceitar_termos': '1'})
+        # Aquecimento: primeira requisição de cada worker carrega catálogo e compila templates
+        gerar_carga(base, clientes, 2)
+        latencias, erros = gerar_carga(base, clientes, duracao)
+
+        workers = filhos(processo.pid)
+        memorias = [memoria_kb(pid) for pid in workers]
+        pss_total = (sum(m[0] for m in memorias) + memoria_kb(processo.pid)[0]) / 1024
+        privada_media = sum(m[1] for m in memorias) / max(1, len(memorias)) / 1024
+
+        if latencias:
+            p50 = latencias[len(latencias) // 2] * 1000
+            p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))] * 1000
+        else:
+            p50 = p95 = 0
+        print(f"   {nome:<20} {len(latencias) / duracao:8.1f} req/s | p50 {p50:7.1f} ms | p95 {p95:7.1f} ms "
+              f"| {erros} erro(s) | {len(workers)} worker(s), PSS total {pss_total:6.1f} MB, "
+              f"privada/worker {privada_media:5.1f} MB")
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos perfis do gunicorn_config.py')
+    parser.add_argument('--duracao', type=int, default=15, help='Segundos de carga por perfil')
+    parser.add_argument('--clientes', type=int, default=16, help='Clientes simultâneos')
+    parser.add_argument('--perfis', nargs='+', default=['original', 'sync', 'gthread'], choices=list(PERFIS))
+    args = parser.parse_args()
+
+    import gunicorn_config
+    print(f"🔬 {gunicorn_config.cpus_disponiveis()} CPU(s), {gunicorn_config.memoria_disponivel_mb()} MB; "
+          f"{args.clientes} clientes por {args.duracao}s em {', '.join(PAGINAS)}")
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        banco = os.path.join(diretorio, 'benchmark.db')
+        # Passo de release, como no deploy: os workers só conferem a versão do schema
+        subprocess.run([sys.executable, 'init_db.py'], check=True, stdout=subprocess.DEVNULL,
+                       env={**os.environ, 'DATABASE_URL': f'sqlite:///{banco}', 'SECRET_KEY': 'benchmark'})
+        for nome in args.perfis:
+            medir_perfil(nome, banco, args.clientes, args.duracao)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Mede o custo de conexão nas chamadas à Stripe usando o stripe_falso.py no lugar da API.
+
+Uso: python benchmark_stripe.py [--chamadas 200] [--threads 4] [--latencia-ms 0]
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+import urllib3
+from stripe.http_client import RequestsClient
+
+from stripe_http import ClienteHttpStripe
+from stripe_falso import ServidorStripeFalso
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+class ClienteSemReuso(RequestsClient):
+    """Abre uma conexão nova a cada chamada, como acontece na primeira chamada de cada thread"""
+
+    def _request_internal(self, method, url, headers, post_data, is_streaming):
+        self._thread_local.session = None
+        return super()._request_internal(method, url, headers, post_data, is_streaming)
+
+
+def medir(nome, cliente, servidor, chamadas, threads):
+    stripe.default_http_client = cliente
+    servidor.conexoes = 0
+    latencias = []
+
+    def chamar(i):
+        inicio = time.perf_counter()
+        stripe.Price.retrieve(f'price_{i % 4}')
+        latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(chamar, range(chamadas)))
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+    print(f"   {nome:<24} {total * 1000:8.1f} ms total | média {sum(latencias) / len(latencias) * 1000:6.2f} ms "
+          f"| p95 {p95 * 1000:6.2f} ms | {servidor.conexoes} conexões")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do pool HTTP da Stripe contra um servidor local')
+    parser.add_argument('--chamadas', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Latência simulada da Stripe (mediana)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        servidor = ServidorStripeFalso(latencia_ms=args.latencia_ms, tls=True)
+        base = servidor.iniciar(diretorio)
+        stripe.api_key = 'sk_test_benchmark'
+        stripe.api_base = base
+        stripe.max_network_retries = 0
+        print(f"🔬 {args.chamadas} chamadas Price.retrieve em {args.threads} threads contra {base}")
+
+        medir('conexão nova por chamada', ClienteSemReuso(verify_ssl_certs=False), servidor, args.chamadas, args.threads)
+        medir('padrão da biblioteca', RequestsClient(verify_ssl_certs=False), servidor, args.chamadas, args.threads)
+        compartilhado = ClienteHttpStripe(max_conexoes=args.threads, verify_ssl_certs=False)
+        medir('pool compartilhado', compartilhado, servidor, args.chamadas, args.threads)
+        print(f"📊 Pool: {compartilhado.estatisticas()}")
+        servidor.parar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Mede a subida a frio de um worker: tempo de import por pacote (-X importtime) e tempo até /pronto.
+
+Cada repetição importa o wsgi.py num processo Python novo sobre um banco SQLite já migrado.
+Depois sobe o gunicorn com e sem aquecimento (AQUECIMENTO=0) e compara a primeira
+requisição de cada página com a latência estável.
+O resultado pode ser salvo em JSON e comparado com uma medição anterior.
+
+Uso: python benchmark_subida.py [--repeticoes 5] [--salvar subida.json] [--comparar subida.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import requests
+
+from benchmark_gunicorn import porta_livre
+
+# Imprime, ao fim da subida e do aquecimento do worker, o que o processo carregou
+SONDA = ("import json, sys, wsgi; wsgi.preparar_worker(); "
+         "print('SONDA ' + json.dumps({'subida_ms': wsgi.prontidao['subida_ms'], "
+         "'aquecimento_worker_ms': wsgi.prontidao['aquecimento_worker_ms'], "
+         "'stripe': 'stripe' in sys.modules, 'modulos': len(sys.modules)}))")
+
+# Páginas públicas com os maiores templates; a primeira requisição de cada uma é a "fria"
+PAGINAS = ['/', '/login', '/cadastro', '/termos-uso', '/politica-privacidade']
+
+
+def ler_importtime(saida):
+    """Tempo próprio (us) somado por pacote de topo, a partir da saída do -X importtime"""
+    por_pacote = defaultdict(int)
+    for linha in saida.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, _, nome = linha[len('import time:'):].split('|')
+        por_pacote[nome.strip().split('.')[0]] += int(proprio)
+    return por_pacote
+
+
+def medir_import(ambiente, codigo):
+    """(tempo total do processo em ms, importtime por pacote, saída padrão)"""
+    inicio = time.perf_counter()
+    processo = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo], env=ambiente,
+                              capture_output=True, text=True, check=True)
+    return (time.perf_counter() - inicio) * 1000, ler_importtime(processo.stderr), processo.stdout
+
+
+def latencia_ms(url):
+    inicio = time.perf_counter()
+    requests.get(url, timeout=30)
+    return (time.perf_counter() - inicio) * 1000
+
+
+def medir_pronto(ambiente, limite=60, estaveis=20):
+    """Sobe o gunicorn (1 worker): ms até /pronto = 200, primeira requisição e mediana estável por página"""
+    porta = porta_livre()
+    base = f'http://127.0.0.1:{porta}'
+    inicio = time.perf_counter()
+    processo = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', 'wsgi:application'],
+                                env={**ambiente, 'PORT': str(porta), 'WEB_CONCURRENCY': '1'},
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        pronto = None
+        while pronto is None and time.perf_counter() - inicio < limite:
+            if processo.poll() is not None:
+                raise RuntimeError('gunicorn encerrou antes de ficar pronto')
+            try:
+                if requests.get(base + '/pronto', timeout=1).status_code == 200:
+                    pronto = (time.perf_counter() - inicio) * 1000
+            except requests.RequestException:
+                time.sleep(0.02)
+        if pronto is None:
+            raise RuntimeError('gunicorn não ficou pronto a tempo')
+
+        primeiras = {pagina: latencia_ms(base + pagina) for pagina in PAGINAS}
+        estaveis = {pagina: statistics.median(latencia_ms(base + pagina) for _ in range(estaveis))
+                    for pagina in PAGINAS}
+        return pronto, primeiras, estaveis
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da subida a frio do wsgi.py')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Processos novos medidos (vale a mediana)')
+    parser.add_argument('--top', type=int, default=12, help='Pacotes listados no detalhamento')
+    parser.add_argument('--salvar', help='Grava o resultado em JSON')
+    parser.add_argument('--comparar', help='JSON de uma medição anterior para mostrar a diferença')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        ambiente = {**os.environ, 'DATABASE_URL': f"sqlite:///{os.path.join(diretorio, 'subida.db')}",
+                    'SECRET_KEY': 'benchmark'}
+        subprocess.run([sys.executable, 'init_db.py'], env=ambiente, check=True, stdout=subprocess.DEVNULL)
+        # Primeira execução só compila os .pyc, como acontece no build
+        medir_import(ambiente, SONDA)
+
+        processos, subidas, aquecimentos, pacotes = [], [], [], defaultdict(list)
+        for _ in range(args.repeticoes):
+            total, por_pacote, saida = medir_import(ambiente, SONDA)
+            sonda = json.loads(saida.split('SONDA ', 1)[1])
+            processos.append(total)
+            subidas.append(sonda['subida_ms'])
+            aquecimentos.append(sonda['aquecimento_worker_ms'])
+            for nome, us in por_pacote.items():
+                pacotes[nome].append(us)
+
+        # Custo que sai da subida e vai para a primeira requisição de pagamento
+        _, stripe_adiado, _ = medir_import(ambiente, 'import stripe_http')
+        pronto, primeiras, estaveis = medir_pronto(ambiente)
+        _, primeiras_sem, _ = medir_pronto({**ambiente, 'AQUECIMENTO': '0'})
+
+    resultado = {
+        'processo_ms': round(statistics.median(processos)),
+        'subida_wsgi_ms': round(statistics.median(subidas)),
+        'aquecimento_worker_ms': round(statistics.median(aquecimentos)),
+        'gunicorn_pronto_ms': round(pronto),
+        'primeira_requisicao_max_ms': round(max(primeiras.values()), 1),
+        'primeira_requisicao_sem_aquecimento_max_ms': round(max(primeiras_sem.values()), 1),
+        'estavel_max_ms': round(max(estaveis.values()), 1),
+        'stripe_na_subida': sonda['stripe'],
+        'modulos_carregados': sonda['modulos'],
+        'stripe_adiado_ms': round(sum(us for nome, us in stripe_adiado.items()
+                                      if nome in ('stripe', 'requests', 'urllib3', 'stripe_http')) / 1000),
+        'pacotes_ms': {nome: round(statistics.median(us) / 1000, 1)
+                       for nome, us in sorted(pacotes.items(), key=lambda p: -statistics.median(p[1]))},
+    }
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            anterior = json.load(arquivo)
+
+    def diferenca(chave, valor, base):
+        if not base or chave not in base:
+            return ''
+        return f" ({valor - base[chave]:+.0f})"
+
+    print(f"🚀 Subida a frio do wsgi.py, mediana de {args.repeticoes} processo(s):")
+    for chave, rotulo in [('processo_ms', 'processo python -c "import wsgi"'),
+                          ('subida_wsgi_ms', 'imports + aquecimento no wsgi'),
+                          ('aquecimento_worker_ms', 'aquecimento por worker (pós-fork)'),
+                          ('gunicorn_pronto_ms', 'gunicorn até /pronto = 200'),
+                          ('stripe_adiado_ms', 'SDK da Stripe (adiado)')]:
+        print(f"   {rotulo:<34} {resultado[chave]:7.0f} ms{diferenca(chave, resultado[chave], anterior)}")
+    print(f"   stripe importado na subida: {'sim' if resultado['stripe_na_subida'] else 'não'}, "
+          f"{resultado['modulos_carregados']} módulos em sys.modules")
+    print("⏱️ Primeira requisição x estável, por página (gunicorn, 1 worker):")
+    for pagina in PAGINAS:
+        print(f"   {pagina:<24} primeira {primeiras[pagina]:6.1f} ms | sem aquecimento {primeiras_sem[pagina]:6.1f} ms "
+              f"| estável {estaveis[pagina]:6.1f} ms")
+    print(f"📦 Tempo próprio de import por pacote (top {args.top}):")
+    for nome, ms in list(resultado['pacotes_ms'].items())[:args.top]:
+        print(f"   {nome:<28} {ms:7.1f} ms{diferenca(nome, ms, (anterior or {}).get('pacotes_ms'))}")
+
+    if args.salvar:
+        with open(args.salvar, 'w') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultado salvo em {args.salvar}")
+
+
+if __name__ == '__main__':
+    main()
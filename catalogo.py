@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from sqlalchemy import func
+
+from models import db, Exercicio
+from modulos import ordem_dos_modulos, montar_registro, validar_registro
+
+# Intervalo mínimo entre verificações de conteúdo novo no banco (segundos)
+CATALOGO_VERIFICACAO = int(os.environ.get('CATALOGO_VERIFICACAO', 30))
+
+
+@dataclass(frozen=True)
+class ExercicioCatalogo:
+    """Cópia somente leitura de um Exercicio, desacoplada da sessão do banco"""
+    id: int
+    pergunta: str
+    codigo_exemplo: str
+    resposta_correta: str
+    nivel: str
+    teoria: str
+    premium: bool
+    tipo: str
+    opcoes: tuple
+    modulo: str
+    ordem_no_modulo: int
+    eh_desafio_final: bool
+    dica: str
+
+    @classmethod
+    def de_modelo(cls, exercicio):
+        opcoes = json.loads(exercicio.opcoes) if exercicio.opcoes else []
+        return cls(
+            id=exercicio.id,
+            pergunta=exercicio.pergunta,
+            codigo_exemplo=exercicio.codigo_exemplo,
+            resposta_correta=exercicio.resposta_correta,
+            nivel=exercicio.nivel,
+            teoria=exercicio.teoria,
+            premium=bool(exercicio.premium),
+            tipo=exercicio.tipo or 'completion',
+            opcoes=tuple(opcoes),
+            modulo=exercicio.modulo,
+            ordem_no_modulo=exercicio.ordem_no_modulo or 0,
+            eh_desafio_final=bool(exercicio.eh_desafio_final),
+            dica=exercicio.dica
+        )
+
+    def get_opcoes(self):
+        return list(self.opcoes)
+
+
+class Catalogo:
+    """Índices imutáveis dos exercícios; uma recarga cria um catálogo novo"""
+
+    def __init__(self, exercicios, versao):
+        self.versao = versao
+        self.carregado_em = time.time()
+
+        ordenados = sorted(exercicios, key=lambda e: e.id)
+        self.todos = tuple(ordenados)
+        self.por_id = MappingProxyType({e.id: e for e in ordenados})
+        self.gratuitos = tuple(e for e in ordenados if not e.premium)
+        self.premium = tuple(e for e in ordenados if e.premium)
+
+        por_modulo = {}
+        por_nivel = {}
+        for exercicio in ordenados:
+            por_modulo.setdefault(exercicio.modulo, []).append(exercicio)
+            por_nivel.setdefault(exercicio.nivel, []).append(exercicio)
+        self.por_modulo = MappingProxyType({
+            modulo: tuple(sorted(lista, key=lambda e: (e.ordem_no_modulo, e.id)))
+            for modulo, lista in por_modulo.items()
+        })
+        self.por_nivel = MappingProxyType({nivel: tuple(lista) for nivel, lista in por_nivel.items()})
+        self.modulos = montar_registro(self.por_modulo)
+        self._montar_navegacao()
+
+    def _montar_navegacao(self):
+        """Sucessor e antecessor de cada exercício, atravessando módulos na ordem de MODULOS"""
+        proximo = {}
+        anterior = {}
+        ordem = ordem_dos_modulos()
+        conhecidos = set(ordem)
+        # Módulos fora de MODULOS formam sequências isoladas, sem ligação com os demais
+        sequencias = [[e for m in ordem for e in self.do_modulo(m)]]
+        sequencias += [list(self.por_modulo[m]) for m in sorted(self.por_modulo, key=str) if m not in conhecidos]
+
+        for sequencia in sequencias:
+            for atual, seguinte in zip(sequencia, sequencia[1:]):
+                proximo[atual.id] = seguinte.id
+                anterior[seguinte.id] = atual.id
+
+        self.proximo = MappingProxyType(proximo)
+        self.anterior = MappingProxyType(anterior)
+
+    def get(self, exercicio_id):
+        try:
+            return self.por_id.get(int(exercicio_id))
+        except (TypeError, ValueError):
+            return None
+
+    def do_modulo(self, modulo_id):
+        return self.por_modulo.get(modulo_id, ())
+
+    def modulo(self, modulo_id):
+        return self.modulos.get(modulo_id)
+
+    def proximo_de(self, exercicio_id):
+        return self.por_id.get(self.proximo.get(exercicio_id))
+
+    def anterior_de(self, exercicio_id):
+        return self.por_id.get(self.anterior.get(exercicio_id))
+
+    def __len__(self):
+        return len(self.todos)
+
+
+_catalogo = None
+_ultima_verificacao = 0.0
+_lock = threading.Lock()
+
+
+def versao_conteudo():
+    """Carimbo barato do conteúdo: muda sempre que populate_exercises recria as linhas"""
+    total, maior_id, ultima_criacao = db.session.query(
+        func.count(Exercicio.id), func.max(Exercicio.id), func.max(Exercicio.data_criacao)
+    ).one()
+    return f"{total}:{maior_id or 0}:{ultima_criacao.isoformat() if ultima_criacao else '-'}"
+
+
+def carregar_catalogo():
+    """Lê todos os exercícios e troca o catálogo atual de forma atômica"""
+    global _catalogo, _ultima_verificacao
+    with _lock:
+        versao = versao_conteudo()
+        exercicios = [ExercicioCatalogo.de_modelo(e) for e in Exercicio.query.all()]
+        _catalogo = Catalogo(exercicios, versao)
+        _ultima_verificacao = time.monotonic()
+        print(f"📚 Catálogo carregado: {len(_catalogo)} exercícios (versão {versao})")
+        problemas = validar_registro(_catalogo.modulos, _catalogo.por_modulo)
+        if problemas:
+            print(f"⚠️ {len(problemas)} inconsistência(s) entre MODULOS e os exercícios: {'; '.join(problemas)}")
+        return _catalogo
+
+
+def obter_catalogo():
+    """Catálogo atual; recarrega apenas se o carimbo de versão no banco mudou"""
+    global _ultima_verificacao
+    catalogo = _catalogo
+    if catalogo is None:
+        return carregar_catalogo()
+
+    if time.monotonic() - _ultima_verificacao >= CATALOGO_VERIFICACAO:
+        _ultima_verificacao = time.monotonic()
+        try:
+            if versao_conteudo() != catalogo.versao:
+                return carregar_catalogo()
+        except Exception as e:
+            print(f"⚠️ Erro ao verificar versão do catálogo: {str(e)}")
+    return catalogo
@@ -0,0 +1,138 @@
+import os
+import secrets
+import threading
+import time
+
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import select, func, delete
+
+from models import db, ChaveSessao, insert_com_conflito
+
+# Quantas chaves (a atual e as anteriores) ainda validam sessões
+CHAVES_MANTIDAS = int(os.environ.get('CHAVES_MANTIDAS', 3))
+# Intervalo para perceber uma rotação feita por outro processo ou instância (segundos)
+CHAVES_VERIFICACAO = int(os.environ.get('CHAVES_VERIFICACAO', 60))
+
+
+def chaves_do_ambiente():
+    """SECRET_KEY e SECRET_KEY_ANTERIORES (separadas por vírgula), da mais antiga para a atual"""
+    atual = os.environ.get('SECRET_KEY')
+    if not atual:
+        return None
+    anteriores = [c.strip() for c in os.environ.get('SECRET_KEY_ANTERIORES', '').split(',') if c.strip()]
+    return anteriores + [atual]
+
+
+def _inserir_chave(conexao, versao):
+    # ON CONFLICT: workers subindo juntos criam a mesma versão uma única vez
+    conexao.execute(
+        insert_com_conflito(ChaveSessao)
+        .values(versao=versao, chave=secrets.token_hex(32))
+        .on_conflict_do_nothing(index_elements=['versao'])
+    )
+
+
+def chaves_do_banco():
+    """Chaves persistidas, da mais antiga para a atual; cria a primeira se a tabela estiver vazia"""
+    consulta = select(ChaveSessao.chave).order_by(ChaveSessao.versao.desc()).limit(CHAVES_MANTIDAS)
+    with db.engine.begin() as conexao:
+        chaves = conexao.execute(consulta).scalars().all()
+        if not chaves:
+            _inserir_chave(conexao, 1)
+            chaves = conexao.execute(consulta).scalars().all()
+    return list(reversed(chaves))
+
+
+def rotacionar_chave():
+    """Cria uma nova chave de assinatura; as CHAVES_MANTIDAS - 1 anteriores continuam validando"""
+    with db.engine.begin() as conexao:
+        versao = (conexao.execute(select(func.max(ChaveSessao.versao))).scalar() or 0) + 1
+        _inserir_chave(conexao, versao)
+        # Chaves que já não validam nenhuma sessão não precisam ficar guardadas
+        conexao.execute(delete(ChaveSessao).where(ChaveSessao.versao <= versao - CHAVES_MANTIDAS))
+    return versao
+
+
+class ChaveiroSessao:
+    """Chaves da sessão em cache no processo, recarregadas a cada CHAVES_VERIFICACAO segundos"""
+
+    def __init__(self, verificacao=CHAVES_VERIFICACAO):
+        self.verificacao = verificacao
+        self._chaves = chaves_do_ambiente()
+        self._fixas = self._chaves is not None
+        # monotonic() pode ser menor que o intervalo logo após o boot: -inf força a primeira carga
+        self._carregado_em = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def origem(self):
+        return 'ambiente' if self._fixas else 'banco'
+
+    def obter(self):
+        if self._fixas or time.monotonic() - self._carregado_em < self.verificacao:
+            return self._chaves
+        with self._lock:
+            if time.monotonic() - self._carregado_em >= self.verificacao:
+                try:
+                    self._chaves = chaves_do_banco()
+                except Exception as e:
+                    if not self._chaves:
+                        raise
+                    print(f"⚠️ Erro ao recarregar chaves da sessão, mantendo as atuais: {str(e)}")
+                self._carregado_em = time.monotonic()
+        return self._chaves
+
+    def recarregar(self, intervalo_minimo=5):
+        """Força a leitura do banco (limitada a uma por intervalo); True se surgiu chave nova"""
+        if self._fixas or time.monotonic() - self._carregado_em < intervalo_minimo:
+            return False
+        anteriores = self._chaves
+        self._carregado_em = float('-inf')
+        return self.obter() != anteriores
+
+
+class SessaoComRotacao(SecureCookieSessionInterface):
+    """Cookie de sessão assinado pela chave atual e verificado por qualquer chave mantida"""
+
+    def __init__(self, chaveiro):
+        self.chaveiro = chaveiro
+
+    def open_session(self, app, request):
+        sessao = super().open_session(app, request)
+        if not sessao and request.cookies.get(self.get_cookie_name(app)) and self.chaveiro.recarregar():
+            # Cookie assinado por uma chave que outro processo já adotou após uma rotação
+            sessao = super().open_session(app, request)
+        return sessao
+
+    def get_signing_serializer(self, app):
+        signer_kwargs = dict(
+            key_derivation=self.key_derivation, digest_method=self.digest_method
+        )
+        # itsdangerous assina com a última chave da lista e aceita qualquer uma delas
+        return URLSafeTimedSerializer(
+            self.chaveiro.obter(),
+            salt=self.salt,
+            serializer=self.serializer,
+            signer_kwargs=signer_kwargs,
+        )
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Chaves de assinatura das sessões')
+    parser.add_argument('comando', choices=['rotacionar', 'status'])
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if chaves_do_ambiente():
+            print("⚠️ SECRET_KEY definida no ambiente: as chaves do banco não são usadas. "
+                  "Para rotacionar, mova a atual para SECRET_KEY_ANTERIORES e defina uma nova.")
+        if args.comando == 'rotacionar':
+            versao = rotacionar_chave()
+            print(f"🔐 Nova chave de sessão: versão {versao} (workers adotam em até {CHAVES_VERIFICACAO}s)")
+        else:
+            for versao, criada_em in db.session.query(ChaveSessao.versao, ChaveSessao.criada_em).order_by(ChaveSessao.versao):
+                print(f"   versão {versao} - criada em {criada_em}")
@@ -0,0 +1,29 @@
+import hashlib
+import json
+
+
+def serializar_estado(estado):
+    """Converte o estado de vidas para o formato enviado ao navegador"""
+    proxima = estado['proxima_vida_em']
+    return {
+        'vidas': estado['vidas'],
+        'premium': estado['premium'],
+        'proxima_vida_em': proxima.isoformat() + 'Z' if proxima else None
+    }
+
+
+def versao_estado(estado):
+    """Impressão digital do estado serializado; muda quando vidas, prazo ou premium mudam"""
+    return hashlib.sha1(json.dumps(estado, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def formatar_evento(nome, dados, retry_ms=None, id_evento=None):
+    """Monta uma mensagem Server-Sent Events"""
+    linhas = []
+    if retry_ms is not None:
+        linhas.append(f"retry: {int(retry_ms)}")
+    if id_evento is not None:
+        linhas.append(f"id: {id_evento}")
+    linhas.append(f"event: {nome}")
+    linhas.append(f"data: {json.dumps(dados)}")
+    return "\n".join(linhas) + "\n\n"
@@ -1,11 +1,70 @@
+import gc
+import math
 import os
 import sys
 
+
+def _ler(caminho):
+    try:
+        with open(caminho) as arquivo:
+            return arquivo.read().strip()
+    except OSError:
+        return None
+
+
+def cpus_disponiveis():
+    """CPUs que este processo pode usar, respeitando afinidade e cota do cgroup (containers)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2 ("cota período") ou v1 (arquivos separados)
+    cota = _ler('/sys/fs/cgroup/cpu.max')
+    if cota:
+        limite, periodo = (cota.split() + ['100000'])[:2]
+    else:
+        limite, periodo = _ler('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'), _ler('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if limite and limite not in ('max', '-1') and periodo:
+        cpus = min(cpus, max(1, math.ceil(int(limite) / int(periodo))))
+    return max(1, cpus)
+
+
+def memoria_disponivel_mb():
+    """Memória do container (cgroup) ou da máquina, em MB"""
+    for caminho in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        limite = _ler(caminho)
+        # Sem limite, o cgroup v1 reporta um número gigante em vez de "max"
+        if limite and limite.isdigit() and int(limite) < 1 << 50:
+            return int(limite) // (1024 * 1024)
+    meminfo = _ler('/proc/meminfo')
+    if meminfo:
+        for linha in meminfo.splitlines():
+            if linha.startswith('MemTotal:'):
+                return int(linha.split()[1]) // 1024
+    return 512
+
+
+def calcular_workers(cpus, memoria_mb, memoria_por_worker_mb):
+    """2 x CPUs + 1, limitado pelo que cabe na memória"""
+    return max(1, min(2 * cpus + 1, memoria_mb // memoria_por_worker_mb))
+
+
+# Perfil: "gthread" (workers com threads, bom para SSE e chamadas à Stripe) ou "sync"
+PERFIL = os.environ.get('GUNICORN_PERFIL', 'gthread')
+# Memória estimada por worker depois do fork (as páginas do preload são compartilhadas)
+MEMORIA_POR_WORKER_MB = int(os.environ.get('GUNICORN_MEMORIA_POR_WORKER', 120))
+
 # Configurações básicas
 bind = "0.0.0.0:" + os.environ.get("PORT", "10000")
-workers = 1
-threads = 2
-worker_class = "sync"
+workers = int(os.environ.get('WEB_CONCURRENCY') or
+              calcular_workers(cpus_disponiveis(), memoria_disponivel_mb(), MEMORIA_POR_WORKER_MB))
+if PERFIL == 'gthread':
+    worker_class = "gthread"
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+else:
+    worker_class = "sync"
+    threads = 1
 worker_connections = 1000
 timeout = 120
 keepalive = 2
@@ -18,7 +77,8 @@ if sys.platform == "win32":
     preload_app = False
     # Desativa recursos específicos do Unix
 else:
-    preload_app = False
+    # Catálogo, templates e módulos carregados uma vez no master e compartilhados (copy-on-write)
+    preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
 
 # Logging
 accesslog = "-"
@@ -32,4 +92,30 @@ pidfile = None
 umask = 0
 user = None
 group = None
-tmp_upload_dir = None
\ No newline at end of file
+tmp_upload_dir = None
+
+
+def when_ready(server):
+    server.log.info(f"Perfil {PERFIL}: {workers} worker(s) x {threads} thread(s), preload={preload_app}")
+    if preload_app:
+        # O master não atende requisições: devolve ao banco as conexões abertas na subida
+        from app import app, db
+        with app.app_context():
+            db.engine.dispose()
+        # Objetos do preload saem do alcance do GC: as varreduras nos workers não sujam essas páginas
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    # Conexões abertas pelo master no preload não podem ser usadas por vários processos
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # Roda no worker depois de carregar a aplicação e antes de aceitar conexões
+    from wsgi import preparar_worker
+    preparar_worker(conexoes=worker.cfg.threads)
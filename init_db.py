@@ -1,20 +1,12 @@
-from app import app, db
-from models import Exercicio
+from app import app, criar_dados_iniciais
+from migracoes import preparar_banco
 
 def init_database():
+    """Passo de release: roda uma vez por deploy, antes de subir os workers"""
     with app.app_context():
-        print("🔄 Criando tabelas...")
-        db.create_all()
-        print("✅ Tabelas criadas com sucesso!")
-        
-        # Verificar se já existem exercícios
-        if not Exercicio.query.first():
-            print("🔄 Criando dados iniciais...")
-            from app import criar_dados_iniciais
-            criar_dados_iniciais()
-            print("✅ Dados iniciais criados!")
-        
+        print("🔄 Criando tabelas e aplicando migrações...")
+        preparar_banco(criar_dados_iniciais)
         print("🎉 Banco de dados inicializado com sucesso!")
 
 if __name__ == '__main__':
-    init_database()
\ No newline at end of file
+    init_database()
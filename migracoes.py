@@ -0,0 +1,287 @@
+import argparse
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import text, insert, update, inspect, func
+
+from models import (db, SchemaVersao, Exercicio, EventoWebhook, EventoReembolso, Transacao, ChaveSessao,
+                    FILTRO_TRANSACOES_VISIVEIS)
+
+
+# Chave do advisory lock que serializa o bootstrap entre deploys e instâncias
+BLOQUEIO_BOOTSTRAP = 820_147_351
+
+
+def _eh_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+@contextmanager
+def bloqueio_bootstrap():
+    """Um bootstrap por vez: advisory lock no PostgreSQL (liberado mesmo se o processo morrer)"""
+    if not _eh_postgres():
+        # SQLite é só desenvolvimento local, com um único processo rodando o bootstrap
+        yield
+        return
+
+    # Conexão dedicada: o lock de sessão vale enquanto ela estiver aberta, fora das transações das migrações
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+        if not conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"), {'chave': BLOQUEIO_BOOTSTRAP}).scalar():
+            print("⏳ Outro processo está aplicando o bootstrap, aguardando...")
+            conexao.execute(text("SELECT pg_advisory_lock(:chave)"), {'chave': BLOQUEIO_BOOTSTRAP})
+        try:
+            yield
+        finally:
+            conexao.execute(text("SELECT pg_advisory_unlock(:chave)"), {'chave': BLOQUEIO_BOOTSTRAP})
+
+
+def criar_indice(nome, tabela, colunas, onde=None, unico=False):
+    """Cria um índice sem bloquear escritas (CONCURRENTLY no PostgreSQL); `onde` o torna parcial"""
+    definicao = f"{tabela} ({', '.join(colunas)})"
+    if onde:
+        definicao += f" WHERE {onde}"
+    tipo = 'UNIQUE INDEX' if unico else 'INDEX'
+
+    if not _eh_postgres():
+        with db.engine.begin() as conexao:
+            conexao.execute(text(f"CREATE {tipo} IF NOT EXISTS {nome} ON {definicao}"))
+        return
+
+    # CREATE INDEX CONCURRENTLY não pode rodar dentro de uma transação
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+        # Uma construção concorrente interrompida deixa o índice inválido; refaz do zero
+        invalido = conexao.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :nome AND NOT i.indisvalid"
+        ), {'nome': nome}).first()
+        if invalido:
+            conexao.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}"))
+        conexao.execute(text(f"CREATE {tipo} CONCURRENTLY IF NOT EXISTS {nome} ON {definicao}"))
+
+
+def remover_indice(nome):
+    """DROP INDEX sem bloquear escritas (CONCURRENTLY no PostgreSQL)"""
+    if not _eh_postgres():
+        with db.engine.begin() as conexao:
+            conexao.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+        return
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+        conexao.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}"))
+
+
+def adicionar_coluna(tabela, coluna, tipo):
+    """ALTER TABLE ADD COLUMN, ignorando colunas que o create_all já criou"""
+    if coluna in {c['name'] for c in inspect(db.engine).get_columns(tabela)}:
+        return
+    with db.engine.begin() as conexao:
+        conexao.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"))
+
+
+def migracao_001_indices_consultas_frequentes():
+    criar_indice('ix_exercicio_modulo_ordem', 'exercicio', ['modulo', 'ordem_no_modulo'])
+    criar_indice('ix_exercicio_premium', 'exercicio', ['premium'])
+    criar_indice('ix_transacao_usuario_data', 'transacao', ['usuario_id', 'data_transacao'])
+    criar_indice('ix_transacao_stripe_session_id', 'transacao', ['stripe_session_id'])
+    criar_indice('ix_transacao_stripe_payment_intent', 'transacao', ['stripe_payment_intent'])
+    criar_indice('ix_progresso_exercicio_id', 'progresso', ['exercicio_id'])
+
+
+def migracao_002_caixa_entrada_webhooks():
+    EventoWebhook.__table__.create(db.engine, checkfirst=True)
+
+
+def migracao_003_eventos_reembolso(lote=500):
+    """Explode os blobs tracking_reembolso em linhas de EventoReembolso, um lote por transação do banco"""
+    EventoReembolso.__table__.create(db.engine, checkfirst=True)
+    ultimo_id = 0
+    total = 0
+
+    while True:
+        # Paginação por id: cada lote lê só os blobs que vai converter
+        linhas = db.session.query(Transacao.id, Transacao.tracking_reembolso).filter(
+            Transacao.id > ultimo_id,
+            Transacao.tracking_reembolso.isnot(None)
+        ).order_by(Transacao.id).limit(lote).all()
+        if not linhas:
+            break
+
+        eventos = []
+        for transacao_id, tracking in linhas:
+            try:
+                historico = json.loads(tracking) if tracking else []
+            except ValueError:
+                print(f"⚠️ Tracking inválido na transação {transacao_id}, descartado")
+                historico = []
+            for entrada in historico:
+                try:
+                    criado_em = datetime.fromisoformat(entrada.get('timestamp'))
+                except (TypeError, ValueError):
+                    criado_em = None
+                eventos.append({
+                    'transacao_id': transacao_id,
+                    'status': entrada.get('status') or 'desconhecido',
+                    'mensagem': entrada.get('mensagem'),
+                    'dados': json.dumps(entrada.get('dados') or {}, ensure_ascii=False),
+                    'criado_em': criado_em
+                })
+
+        if eventos:
+            db.session.execute(insert(EventoReembolso), eventos)
+        # Limpa o blob na mesma transação: uma execução interrompida recomeça sem duplicar
+        ids = [transacao_id for transacao_id, _ in linhas]
+        db.session.execute(update(Transacao).where(Transacao.id.in_(ids)).values(tracking_reembolso=None))
+        db.session.commit()
+
+        ultimo_id = ids[-1]
+        total += len(eventos)
+
+    print(f"   {total} evento(s) de reembolso migrados")
+
+
+def migracao_004_verificacao_sessao_stripe():
+    adicionar_coluna('transacao', 'verificado_stripe_em', 'TIMESTAMP')
+
+
+def migracao_005_reuso_checkout():
+    adicionar_coluna('transacao', 'stripe_checkout_url', 'TEXT')
+    adicionar_coluna('transacao', 'checkout_expira_em', 'TIMESTAMP')
+
+
+def migracao_006_transacoes_visiveis():
+    criar_indice('ix_transacao_usuario_visiveis', 'transacao', ['usuario_id', 'data_transacao'],
+                 onde=FILTRO_TRANSACOES_VISIVEIS)
+
+
+def migracao_007_chaves_sessao():
+    ChaveSessao.__table__.create(db.engine, checkfirst=True)
+
+
+def migracao_008_sessao_checkout_unica():
+    """Uma transação por sessão de checkout: remove duplicatas pendentes e cria o índice único"""
+    duplicadas = db.session.query(Transacao.stripe_session_id).filter(
+        Transacao.stripe_session_id.isnot(None)
+    ).group_by(Transacao.stripe_session_id).having(func.count() > 1).all()
+
+    removidas = 0
+    for (session_id,) in duplicadas:
+        transacoes = Transacao.query.filter_by(stripe_session_id=session_id).order_by(Transacao.id).all()
+        # Fica a confirmada, se houver; senão a mais antiga
+        manter = next((t for t in transacoes if t.status == 'confirmada'), transacoes[0])
+        for transacao in transacoes:
+            if transacao is manter:
+                continue
+            if transacao.status not in ('pendente', 'expirada'):
+                raise RuntimeError(f"Sessão {session_id} tem mais de uma transação processada; resolva manualmente")
+            db.session.delete(transacao)
+            removidas += 1
+    db.session.commit()
+    print(f"   {removidas} transação(ões) duplicada(s) removida(s)")
+
+    criar_indice('ux_transacao_stripe_session_id', 'transacao', ['stripe_session_id'], unico=True)
+    # O índice único já atende as buscas por sessão
+    remover_indice('ix_transacao_stripe_session_id')
+
+
+def migracao_009_versao_progresso():
+    adicionar_coluna('usuario', 'versao_progresso', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def migracao_010_base_regeneracao():
+    """Grava a base da regeneração das linhas antigas sem ela; sem base o prazo da próxima vida nunca chega"""
+    with db.engine.begin() as conexao:
+        conexao.execute(text("UPDATE usuario SET ultima_regeneracao = CURRENT_TIMESTAMP WHERE ultima_regeneracao IS NULL"))
+        if _eh_postgres():
+            conexao.execute(text("ALTER TABLE usuario ALTER COLUMN ultima_regeneracao SET NOT NULL"))
+
+
+# Lista ordenada: (versão, nome, função). Nunca renumere uma migração já publicada.
+MIGRACOES = [
+    (1, 'indices_consultas_frequentes', migracao_001_indices_consultas_frequentes),
+    (2, 'caixa_entrada_webhooks', migracao_002_caixa_entrada_webhooks),
+    (3, 'eventos_reembolso', migracao_003_eventos_reembolso),
+    (4, 'verificacao_sessao_stripe', migracao_004_verificacao_sessao_stripe),
+    (5, 'reuso_checkout', migracao_005_reuso_checkout),
+    (6, 'transacoes_visiveis', migracao_006_transacoes_visiveis),
+    (7, 'chaves_sessao', migracao_007_chaves_sessao),
+    (8, 'sessao_checkout_unica', migracao_008_sessao_checkout_unica),
+    (9, 'versao_progresso', migracao_009_versao_progresso),
+    (10, 'base_regeneracao', migracao_010_base_regeneracao),
+]
+
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+
+def versoes_aplicadas():
+    return {row.versao for row in db.session.query(SchemaVersao.versao)}
+
+
+def aplicar_migracoes():
+    """Cria tabelas que faltam e aplica, em ordem, as migrações pendentes"""
+    db.create_all()
+    aplicadas = versoes_aplicadas()
+    db.session.rollback()
+
+    pendentes = [m for m in MIGRACOES if m[0] not in aplicadas]
+    for versao, nome, migracao in pendentes:
+        print(f"🔄 Aplicando migração {versao:03d} - {nome}...")
+        migracao()
+        db.session.add(SchemaVersao(versao=versao, nome=nome))
+        db.session.commit()
+        print(f"✅ Migração {versao:03d} aplicada")
+
+    if not pendentes:
+        print(f"✅ Schema já está na versão {VERSAO_ATUAL}")
+    return len(pendentes)
+
+
+def preparar_banco(criar_dados_iniciais=None):
+    """Passo de release: migrações e dados iniciais, sob o lock do bootstrap"""
+    with bloqueio_bootstrap():
+        aplicar_migracoes()
+        if criar_dados_iniciais and not db.session.query(Exercicio.id).first():
+            print("🔄 Criando dados iniciais...")
+            criar_dados_iniciais()
+        db.session.remove()
+
+
+def versao_do_schema():
+    """Maior versão aplicada, ou 0 se o banco nunca passou pelo bootstrap"""
+    if not inspect(db.engine).has_table(SchemaVersao.__table__.name):
+        return 0
+    return db.session.query(func.max(SchemaVersao.versao)).scalar() or 0
+
+
+def verificar_schema():
+    """Checagem da subida dos workers: uma leitura, sem DDL; falha se faltar migração"""
+    versao = versao_do_schema()
+    db.session.remove()
+    if versao < VERSAO_ATUAL:
+        raise RuntimeError(f"Schema na versão {versao}, o código precisa da {VERSAO_ATUAL}: "
+                           f"rode 'python init_db.py' antes de subir os workers")
+    if versao > VERSAO_ATUAL:
+        # Deploy antigo ainda no ar enquanto o novo já migrou: as migrações só acrescentam
+        print(f"⚠️ Schema na versão {versao}, à frente deste código ({VERSAO_ATUAL})")
+    return versao
+
+
+def mostrar_status():
+    aplicadas = versoes_aplicadas()
+    for versao, nome, _ in MIGRACOES:
+        status = '✅' if versao in aplicadas else '⏳'
+        print(f"   {status} {versao:03d} - {nome}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrações de schema do Codignarte')
+    parser.add_argument('--status', action='store_true', help='Apenas lista as migrações e se já foram aplicadas')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.status:
+            db.create_all()
+            mostrar_status()
+        else:
+            with bloqueio_bootstrap():
+                aplicar_migracoes()
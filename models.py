@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.sql import func
 from datetime import datetime, timedelta
 import json
@@ -8,13 +10,59 @@ import string
 
 db = SQLAlchemy()
 
+MAX_VIDAS = 3
+INTERVALO_REGENERACAO = 1800  # 30 minutos em segundos
+# Status exibidos ao usuário; 'expirada' marca checkouts abandonados
+STATUS_TRANSACAO_VISIVEIS = ('pendente', 'confirmada', 'reembolsada')
+# Predicado do índice parcial ix_transacao_usuario_visiveis (modelo e migração 006), gerado da tupla
+# acima; se ela mudar, uma migração nova precisa recriar o índice nos bancos existentes
+FILTRO_TRANSACOES_VISIVEIS = "status IN ({})".format(', '.join(f"'{status}'" for status in STATUS_TRANSACAO_VISIVEIS))
+
+def insert_com_conflito(modelo):
+    """INSERT com suporte a ON CONFLICT no dialeto do banco em uso"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(modelo)
+    return sqlite.insert(modelo)
+
+def premium_ativo(premium, cancelado, data_expiracao, agora=None):
+    """Premium vale se marcado, não cancelado e ainda não expirado"""
+    if not premium or cancelado:
+        return False
+    if data_expiracao and (agora or datetime.utcnow()) > data_expiracao:
+        return False
+    return True
+
+def ciclos_regeneracao(ultima_regeneracao, agora):
+    """Retorna (base, ciclos completos de regeneração desde a base)"""
+    if not ultima_regeneracao:
+        return None, 0
+    base = ultima_regeneracao.replace(tzinfo=None)
+    return base, max(0, int((agora - base).total_seconds() // INTERVALO_REGENERACAO))
+
+def calcular_vidas(vidas, ultima_regeneracao, premium, agora):
+    """Função pura: (vidas efetivas, instante da próxima vida) a partir do que está gravado"""
+    vidas = vidas or 0
+    if premium or vidas >= MAX_VIDAS:
+        return vidas, None
+    
+    base, ciclos = ciclos_regeneracao(ultima_regeneracao, agora)
+    if not base:
+        # Sem base gravada não há prazo estável (agora + 30 min andaria a cada chamada);
+        # a migração 010 preenche a base e o próximo consumo a grava
+        return vidas, None
+    
+    vidas = min(MAX_VIDAS, vidas + ciclos)
+    if vidas >= MAX_VIDAS:
+        return vidas, None
+    return vidas, base + timedelta(seconds=(ciclos + 1) * INTERVALO_REGENERACAO)
+
 class Usuario(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     email = db.Column(db.String(150), unique=True, nullable=False)
     senha = db.Column(db.String(150), nullable=False)
     vidas = db.Column(db.Integer, default=3)
-    ultima_regeneracao = db.Column(db.DateTime, server_default=func.now())
+    ultima_regeneracao = db.Column(db.DateTime, nullable=False, server_default=func.now())
     data_criacao = db.Column(db.DateTime, server_default=func.now())
     premium = db.Column(db.Boolean, default=False)
     data_inicio_premium = db.Column(db.DateTime)
@@ -27,70 +75,108 @@ class Usuario(UserMixin, db.Model):
     vidas_utilizadas_compradas = db.Column(db.Integer, default=0)
     nivel_atual = db.Column(db.String(50), default='iniciante')
     modulo_atual = db.Column(db.String(100), default='variaveis_operadores')
+    # Muda a cada exercício concluído pela primeira vez; chave do cache de progresso (progresso.py)
+    versao_progresso = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     @property
     def is_premium_active(self):
         """Verifica se o usuário tem premium ativo (não cancelado e não expirado)"""
-        if not self.premium:
-            return False
-        if self.premium_cancelado:
-            return False
-        if self.data_expiracao_premium and datetime.utcnow() > self.data_expiracao_premium:
-            return False
-        return True
+        return premium_ativo(self.premium, self.premium_cancelado, self.data_expiracao_premium)
+    
+    @property
+    def vidas_efetivas(self):
+        """Vidas disponíveis agora, já contando a regeneração ainda não gravada"""
+        return self.estado_vidas()['vidas']
     
     def tempo_para_proxima_vida(self):
-        if self.is_premium_active:
+        proxima_vida_em = self.estado_vidas()['proxima_vida_em']
+        if not proxima_vida_em:
             return 0
-            
-        if self.vidas >= 3:
-            return 0
-            
-        agora = datetime.utcnow()
-        
-        if not self.ultima_regeneracao:
-            return 1800  # 30 minutos em segundos
-        
-        # Garantir que ambas as datas estão naive (sem timezone)
-        if isinstance(self.ultima_regeneracao, datetime):
-            ultima_regeneracao_naive = self.ultima_regeneracao.replace(tzinfo=None)
-        else:
-            ultima_regeneracao_naive = self.ultima_regeneracao
-            
-        tempo_decorrido = agora - ultima_regeneracao_naive
-        segundos_passados = tempo_decorrido.total_seconds()
-        
-        tempo_restante = 1800 - segundos_passados
-        
-        if tempo_restante < 0:
-            return 0
-        return int(tempo_restante)
+        return max(0, int((proxima_vida_em - datetime.utcnow()).total_seconds()))
     
-    def regenerar_vidas(self):
+    def regenerar_vidas(self, agora=None):
+        """Grava no objeto as vidas regeneradas (sem commit); usado antes de somar ou remover vidas"""
         if self.is_premium_active:
             return
-            
-        if self.vidas >= 3:
-            return
-            
-        agora = datetime.utcnow()
         
-        if not self.ultima_regeneracao:
+        agora = agora or datetime.utcnow()
+        base, ciclos = self._ciclos_regeneracao(agora)
+        if not base:
             self.ultima_regeneracao = agora
-            return
+        elif ciclos and (self.vidas or 0) < MAX_VIDAS:
+            self.vidas = min(MAX_VIDAS, (self.vidas or 0) + ciclos)
+            # Avança só os ciclos completos para o prazo da próxima vida ficar estável
+            self.ultima_regeneracao = base + timedelta(seconds=ciclos * INTERVALO_REGENERACAO)
+
+    def _ciclos_regeneracao(self, agora):
+        """Retorna (base, ciclos completos de regeneração desde a base)"""
+        return ciclos_regeneracao(self.ultima_regeneracao, agora)
+    
+    def estado_vidas(self, agora=None):
+        """Calcula vidas e o instante da próxima vida sem alterar o usuário"""
+        agora = agora or datetime.utcnow()
+        premium = premium_ativo(self.premium, self.premium_cancelado, self.data_expiracao_premium, agora)
+        vidas, proxima_vida_em = calcular_vidas(self.vidas, self.ultima_regeneracao, premium, agora)
+        return {
+            'vidas': vidas,
+            'premium': premium,
+            'proxima_vida_em': proxima_vida_em
+        }
+
+    def consumir_vida(self, agora=None):
+        """Gasta uma vida com um UPDATE ... RETURNING atômico, sem corrida entre requisições.
         
-        # Garantir que ambas as datas estão naive (sem timezone)
-        if isinstance(self.ultima_regeneracao, datetime):
-            ultima_regeneracao_naive = self.ultima_regeneracao.replace(tzinfo=None)
-        else:
-            ultima_regeneracao_naive = self.ultima_regeneracao
+        Retorna (vidas, vidas_compradas, vidas_utilizadas_compradas) depois do consumo.
+        """
+        tabela = Usuario.__table__
+        colunas = (tabela.c.vidas, tabela.c.vidas_compradas, tabela.c.vidas_utilizadas_compradas)
+        
+        # Vidas compradas ainda não utilizadas são gastas primeiro
+        linha = db.session.execute(
+            update(tabela)
+            .where(tabela.c.id == self.id,
+                   tabela.c.vidas_utilizadas_compradas < tabela.c.vidas_compradas)
+            .values(vidas_utilizadas_compradas=tabela.c.vidas_utilizadas_compradas + 1)
+            .returning(*colunas)
+        ).first()
+        agora = agora or datetime.utcnow()
+        if linha or self.is_premium_active:
+            # As vidas gravadas não mudaram: devolve as efetivas (com a regeneração pendente), não o valor cru
+            vidas_efetivas = self.estado_vidas(agora)['vidas']
+            if linha:
+                return (vidas_efetivas, linha.vidas_compradas, linha.vidas_utilizadas_compradas)
+            return (vidas_efetivas, self.vidas_compradas, self.vidas_utilizadas_compradas)
+
+        for _ in range(3):
+            vidas_efetivas = self.estado_vidas(agora)['vidas']
+            if vidas_efetivas <= 0:
+                return (vidas_efetivas, self.vidas_compradas, self.vidas_utilizadas_compradas)
             
-        tempo_decorrido = agora - ultima_regeneracao_naive
+            base, ciclos = self._ciclos_regeneracao(agora)
+            if base and ciclos == 0 and (self.vidas or 0) < MAX_VIDAS:
+                # Nada a regenerar: decremento puro
+                consulta = update(tabela).where(
+                    tabela.c.id == self.id,
+                    tabela.c.vidas > 0
+                ).values(vidas=tabela.c.vidas - 1)
+            else:
+                # Materializa a regeneração junto com o consumo; saindo do máximo, o relógio começa agora
+                if base and vidas_efetivas < MAX_VIDAS:
+                    nova_base = base + timedelta(seconds=ciclos * INTERVALO_REGENERACAO)
+                else:
+                    nova_base = agora
+                consulta = update(tabela).where(
+                    tabela.c.id == self.id,
+                    tabela.c.vidas == self.vidas
+                ).values(vidas=vidas_efetivas - 1, ultima_regeneracao=nova_base)
+            
+            linha = db.session.execute(consulta.returning(*colunas)).first()
+            if linha:
+                return tuple(linha)
+            # Outra requisição alterou as vidas: relê e tenta de novo
+            db.session.refresh(self)
         
-        if tempo_decorrido.total_seconds() >= 1800:  # 30 minutos
-            vidas_regeneradas = int(tempo_decorrido.total_seconds() // 1800)
-            self.vidas = min(3, self.vidas + vidas_regeneradas)
-            self.ultima_regeneracao = agora
+        return (self.vidas, self.vidas_compradas, self.vidas_utilizadas_compradas)
 
     def verificar_premium_expirado(self):
         """Verifica se o premium expirou e atualiza o status"""
@@ -158,6 +244,11 @@ class Exercicio(db.Model):
     eh_desafio_final = db.Column(db.Boolean, default=False)
     dica = db.Column(db.Text)
     
+    __table_args__ = (
+        db.Index('ix_exercicio_modulo_ordem', 'modulo', 'ordem_no_modulo'),
+        db.Index('ix_exercicio_premium', 'premium'),
+    )
+    
     def get_opcoes(self):
         if self.opcoes:
             return json.loads(self.opcoes)
@@ -173,7 +264,10 @@ class Progresso(db.Model):
     usuario = db.relationship('Usuario', backref=db.backref('progresso', lazy=True))
     exercicio = db.relationship('Exercicio', backref=db.backref('completado_por', lazy=True))
     
-    __table_args__ = (db.UniqueConstraint('usuario_id', 'exercicio_id', name='unique_progresso'),)
+    __table_args__ = (
+        db.UniqueConstraint('usuario_id', 'exercicio_id', name='unique_progresso'),
+        db.Index('ix_progresso_exercicio_id', 'exercicio_id'),
+    )
 
 class ModuloConcluido(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -196,6 +290,9 @@ class Transacao(db.Model):
     stripe_session_id = db.Column(db.String(255))
     stripe_payment_intent = db.Column(db.String(255))
     stripe_refund_id = db.Column(db.String(255))
+    verificado_stripe_em = db.Column(db.DateTime)  # Última consulta da sessão pendente na Stripe
+    stripe_checkout_url = db.Column(db.Text)  # Reaproveitada em cliques repetidos enquanto a sessão é válida
+    checkout_expira_em = db.Column(db.DateTime)
     id_publico = db.Column(db.String(20), unique=True)
     
     # Campos para controle de uso do produto
@@ -209,41 +306,41 @@ class Transacao(db.Model):
     data_processamento_reembolso = db.Column(db.DateTime)
     motivo_reembolso = db.Column(db.String(500))
     valor_reembolsado = db.Column(db.Float, default=0.0)
-    tracking_reembolso = db.Column(db.Text)
+    tracking_reembolso = db.Column(db.Text)  # Legado: histórico agora fica em EventoReembolso (migração 003)
     
     usuario = db.relationship('Usuario', backref=db.backref('transacoes', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_transacao_usuario_data', 'usuario_id', 'data_transacao'),
+        # Único: cliques simultâneos que reaproveitam a mesma sessão gravam uma transação só
+        db.Index('ux_transacao_stripe_session_id', 'stripe_session_id', unique=True),
+        db.Index('ix_transacao_stripe_payment_intent', 'stripe_payment_intent'),
+        # Índice parcial: o histórico do usuário ignora checkouts expirados
+        db.Index('ix_transacao_usuario_visiveis', 'usuario_id', 'data_transacao',
+                 postgresql_where=db.text(FILTRO_TRANSACOES_VISIVEIS),
+                 sqlite_where=db.text(FILTRO_TRANSACOES_VISIVEIS)),
+    )
+    
     def gerar_id_publico(self):
         caracteres = string.ascii_uppercase + string.digits
         return 'CDG' + ''.join(secrets.choice(caracteres) for _ in range(7))
     
     def adicionar_tracking_reembolso(self, status, mensagem, dados=None):
         """Adiciona uma entrada no histórico de tracking do reembolso"""
-        try:
-            tracking = self.tracking_reembolso or '[]'
-            historico = json.loads(tracking)
-            
-            entrada = {
-                'timestamp': datetime.utcnow().isoformat(),
-                'status': status,
-                'mensagem': mensagem,
-                'dados': dados or {}
-            }
-            
-            historico.append(entrada)
-            self.tracking_reembolso = json.dumps(historico, ensure_ascii=False)
-            
-        except Exception as e:
-            print(f"Erro ao adicionar tracking: {str(e)}")
+        # Só insere a nova linha; o histórico existente não é carregado nem reescrito
+        db.session.add(EventoReembolso(transacao=self, status=status, mensagem=mensagem,
+                                       dados=json.dumps(dados or {}, ensure_ascii=False)))
     
     def get_tracking_reembolso(self):
         """Retorna o histórico de tracking do reembolso"""
-        try:
-            if self.tracking_reembolso:
-                return json.loads(self.tracking_reembolso)
-        except:
-            pass
-        return []
+        historico = [evento.como_dict() for evento in self.eventos_reembolso]
+        if self.tracking_reembolso:
+            # Transação ainda não migrada para EventoReembolso
+            try:
+                historico = json.loads(self.tracking_reembolso) + historico
+            except ValueError:
+                pass
+        return historico
     
     def pode_reembolsar(self):
         """Verifica se a transação pode ser reembolsada baseada no uso do produto"""
@@ -319,6 +416,16 @@ class Transacao(db.Model):
             {'refund_id': refund_id}
         )
     
+    def aguardar_reembolso(self, motivo):
+        """Refund enviado sem resposta da Stripe: fica em processamento até a reconciliação encontrá-lo"""
+        self.status_reembolso = 'processando'
+        
+        self.adicionar_tracking_reembolso(
+            'processando',
+            'Reembolso enviado à Stripe, aguardando confirmação',
+            {'motivo': str(motivo)}
+        )
+    
     def completar_reembolso(self, dados_reembolso):
         """Marca o reembolso como completado"""
         self.status_reembolso = 'completado'
@@ -350,4 +457,59 @@ class Transacao(db.Model):
         if self.quantidade_utilizada < self.quantidade_produto:
             self.quantidade_utilizada += 1
             return True
-        return False
\ No newline at end of file
+        return False
+
+class EventoReembolso(db.Model):
+    """Histórico append-only do reembolso de uma transação"""
+    id = db.Column(db.Integer, primary_key=True)
+    transacao_id = db.Column(db.Integer, db.ForeignKey('transacao.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    mensagem = db.Column(db.String(500))
+    dados = db.Column(db.Text)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    transacao = db.relationship('Transacao', backref=db.backref(
+        'eventos_reembolso', lazy=True, order_by='EventoReembolso.id'))
+    
+    __table_args__ = (
+        db.Index('ix_evento_reembolso_transacao', 'transacao_id', 'id'),
+    )
+    
+    def como_dict(self):
+        """Mesmo formato das entradas do antigo tracking_reembolso"""
+        return {
+            'timestamp': self.criado_em.isoformat() if self.criado_em else None,
+            'status': self.status,
+            'mensagem': self.mensagem,
+            'dados': json.loads(self.dados) if self.dados else {}
+        }
+
+class ChaveSessao(db.Model):
+    """Chaves de assinatura das sessões, compartilhadas por todos os workers e instâncias (ver chaves.py)"""
+    versao = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    chave = db.Column(db.String(128), nullable=False)
+    criada_em = db.Column(db.DateTime, server_default=func.now())
+
+class SchemaVersao(db.Model):
+    """Migrações de schema já aplicadas (ver migracoes.py)"""
+    versao = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    nome = db.Column(db.String(100), nullable=False)
+    aplicada_em = db.Column(db.DateTime, server_default=func.now())
+
+class EventoWebhook(db.Model):
+    """Caixa de entrada dos webhooks da Stripe, um registro por id de evento"""
+    id = db.Column(db.String(255), primary_key=True)  # id do evento na Stripe (evt_...)
+    tipo = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    chave_ordenacao = db.Column(db.String(255))  # payment_intent ou id do objeto
+    criado_em_stripe = db.Column(db.Integer)
+    recebido_em = db.Column(db.DateTime, server_default=func.now())
+    status = db.Column(db.String(20), default='pendente')  # pendente, processado, falhou
+    tentativas = db.Column(db.Integer, default=0)
+    proxima_tentativa_em = db.Column(db.DateTime)
+    ultimo_erro = db.Column(db.Text)
+    processado_em = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_evento_webhook_status_proxima', 'status', 'proxima_tentativa_em'),
+    )
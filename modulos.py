@@ -0,0 +1,85 @@
+from types import MappingProxyType
+
+MODULOS = {
+    'iniciante': [
+        {
+            'id': 'variaveis_operadores',
+            'nome': 'Variáveis e Operadores',
+            'descricao': 'Aprenda o básico da programação com variáveis e operações matemáticas',
+            'icone': 'fa-calculator'
+        },
+        {
+            'id': 'estruturas_controle',
+            'nome': 'Estruturas de Controle',
+            'descricao': 'Controle o fluxo do seu código com condições e loops',
+            'icone': 'fa-sitemap'
+        }
+    ],
+    'intermediario': [
+        {
+            'id': 'funcoes',
+            'nome': 'Funções',
+            'descricao': 'Aprenda a criar e usar funções para organizar seu código',
+            'icone': 'fa-cogs'
+        },
+        {
+            'id': 'arrays_objetos',
+            'nome': 'Arrays e Objetos',
+            'descricao': 'Trabalhe com listas e objetos para armazenar dados',
+            'icone': 'fa-layer-group'
+        }
+    ],
+    'avancado': [
+        {
+            'id': 'programacao_assincrona',
+            'nome': 'Programação Assíncrona',
+            'descricao': 'Domine callbacks, promises e async/await',
+            'icone': 'fa-bolt'
+        },
+        {
+            'id': 'dom_manipulation',
+            'nome': 'Manipulação do DOM',
+            'descricao': 'Interaja com páginas web dinamicamente',
+            'icone': 'fa-window-restore'
+        }
+    ]
+}
+
+
+def ordem_dos_modulos():
+    """Ids dos módulos na ordem de estudo: nível a nível, na ordem da lista"""
+    return [modulo['id'] for lista_modulos in MODULOS.values() for modulo in lista_modulos]
+
+
+def montar_registro(exercicios_por_modulo):
+    """Índice id -> módulo com nível, posição e contagens reais de exercícios"""
+    registro = {}
+    posicao = 0
+    for nivel, lista_modulos in MODULOS.items():
+        for posicao_no_nivel, modulo in enumerate(lista_modulos):
+            exercicios = exercicios_por_modulo.get(modulo['id'], ())
+            registro[modulo['id']] = MappingProxyType({
+                **modulo,
+                'nivel': nivel,
+                'posicao': posicao,
+                'posicao_no_nivel': posicao_no_nivel,
+                'total_exercicios': len(exercicios),
+                'total_premium': sum(1 for e in exercicios if e.premium),
+                'tem_desafio_final': any(e.eh_desafio_final for e in exercicios)
+            })
+            posicao += 1
+    return MappingProxyType(registro)
+
+
+def validar_registro(registro, exercicios_por_modulo):
+    """Lista inconsistências entre MODULOS e os exercícios gravados no banco"""
+    problemas = []
+    for modulo_id, modulo in registro.items():
+        if modulo['total_exercicios'] == 0:
+            problemas.append(f"Módulo {modulo_id} não tem exercícios")
+        elif not modulo['tem_desafio_final']:
+            problemas.append(f"Módulo {modulo_id} não tem desafio final")
+    for modulo_id in exercicios_por_modulo:
+        if modulo_id not in registro:
+            problemas.append(f"Exercícios do módulo {modulo_id} não estão em MODULOS")
+    return problemas
@@ -1,6 +1,8 @@
 import json
 from app import app, db
 from models import Exercicio
+from modulos import ordem_dos_modulos, validar_registro
+from catalogo import carregar_catalogo
 from datetime import datetime
 import random
 
@@ -318,9 +320,8 @@ def populate_exercises():
             
             total = Exercicio.query.count()
             
-            # Estatísticas por módulo
-            modulos = ['variaveis_operadores', 'estruturas_controle', 'funcoes', 
-                      'arrays_objetos', 'programacao_assincrona', 'dom_manipulation']
+            # Estatísticas por módulo, na mesma ordem do registro usado pelo site
+            modulos = ordem_dos_modulos()
             
             print(f"\n🏗️  EXERCÍCIOS CRIADOS: {created_count}")
             
@@ -332,6 +333,14 @@ def populate_exercises():
                 status = "✅" if count > 0 else "❌"
                 print(f"   {status} {modulo}: {count} exercícios ({freemium_count} 🎯 + {premium_count} 🔥)")
             
+            # Validar o conteúdo contra o registro de módulos
+            catalogo = carregar_catalogo()
+            problemas = validar_registro(catalogo.modulos, catalogo.por_modulo)
+            if problemas:
+                print("\n⚠️  INCONSISTÊNCIAS COM O REGISTRO DE MÓDULOS:")
+                for problema in problemas:
+                    print(f"   ❌ {problema}")
+            
             print(f"\n✅ POPULAÇÃO CONCLUÍDA COM SUCESSO!")
             print("🎉 TODOS OS MÓDULOS AGORA TEM EXERCÍCIOS!")
             
@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import and_, case, func, update
+
+from models import db, Usuario, Exercicio, Progresso, ModuloConcluido, insert_com_conflito
+
+CACHE_CONCLUIDOS_TAMANHO = int(os.environ.get('CACHE_CONCLUIDOS_TAMANHO', 2048))
+
+
+class ConjuntoConcluidos:
+    """Bitmap imutável dos ids de exercícios concluídos, com teste de pertinência O(1)"""
+    __slots__ = ('_bits', '_total')
+
+    def __init__(self, ids):
+        ids = [i for i in ids if i is not None and i >= 0]
+        self._bits = bytearray((max(ids) >> 3) + 1 if ids else 0)
+        for exercicio_id in ids:
+            self._bits[exercicio_id >> 3] |= 1 << (exercicio_id & 7)
+        self._total = sum(bin(byte).count('1') for byte in self._bits)
+
+    def __contains__(self, exercicio_id):
+        if not isinstance(exercicio_id, int) or exercicio_id < 0:
+            return False
+        indice = exercicio_id >> 3
+        return indice < len(self._bits) and bool(self._bits[indice] & (1 << (exercicio_id & 7)))
+
+    def __len__(self):
+        return self._total
+
+    def __iter__(self):
+        for indice, byte in enumerate(self._bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (indice << 3) | bit
+
+
+class CacheLRU:
+    """Cache em memória do processo com despejo LRU"""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+
+_cache_concluidos = CacheLRU(CACHE_CONCLUIDOS_TAMANHO)
+
+
+def exercicios_concluidos(usuario):
+    """Conjunto de exercícios concluídos do usuário, servido do cache quando possível.
+
+    O item vale só para a versao_progresso com que foi lido; a versão vem na linha
+    do usuário, já carregada pela requisição, e muda no banco a cada acerto novo,
+    então um acerto gravado por qualquer worker invalida o cache de todos.
+    """
+    item = _cache_concluidos.obter(usuario.id)
+    if item is not None and item[0] == usuario.versao_progresso:
+        return item[1]
+    ids = db.session.query(Progresso.exercicio_id).filter(Progresso.usuario_id == usuario.id)
+    conjunto = ConjuntoConcluidos(row.exercicio_id for row in ids)
+    _cache_concluidos.guardar(usuario.id, (usuario.versao_progresso, conjunto))
+    return conjunto
+
+
+def invalidar_concluidos(usuario_id):
+    """Libera o item do usuário neste processo (ex.: conta excluída)"""
+    _cache_concluidos.invalidar(usuario_id)
+
+
+def resumo_por_modulo(usuario_id):
+    """Total, concluídos e desafio final de cada módulo em uma única consulta"""
+    concluido = Progresso.id.isnot(None)
+    linhas = db.session.query(
+        Exercicio.modulo,
+        func.count(Exercicio.id),
+        func.count(Progresso.id),
+        func.max(case((and_(Exercicio.eh_desafio_final.is_(True), concluido), 1), else_=0))
+    ).outerjoin(Progresso, and_(
+        Progresso.exercicio_id == Exercicio.id,
+        Progresso.usuario_id == usuario_id
+    )).group_by(Exercicio.modulo).all()
+
+    return {
+        modulo: {
+            'total': total,
+            'completos': completos,
+            'desafio_concluido': bool(desafio)
+        }
+        for modulo, total, completos, desafio in linhas
+    }
+
+
+def progresso_do_modulo(usuario_id, modulo_id):
+    """Exercícios do módulo em ordem, com conclusão e tentativas do usuário"""
+    linhas = db.session.query(Exercicio, Progresso).outerjoin(Progresso, and_(
+        Progresso.exercicio_id == Exercicio.id,
+        Progresso.usuario_id == usuario_id
+    )).filter(Exercicio.modulo == modulo_id).order_by(Exercicio.ordem_no_modulo).all()
+
+    return [
+        {
+            'exercicio': exercicio,
+            'concluido': progresso is not None,
+            'tentativas': progresso.tentativas if progresso else 0
+        }
+        for exercicio, progresso in linhas
+    ]
+
+
+def registrar_acerto(usuario_id, exercicio, novo_progresso=True):
+    """Grava o acerto com upserts: sem leitura prévia de Progresso ou ModuloConcluido"""
+    tabela = Progresso.__table__
+    db.session.execute(
+        insert_com_conflito(Progresso)
+        .values(usuario_id=usuario_id, exercicio_id=exercicio.id, tentativas=1)
+        .on_conflict_do_update(
+            index_elements=['usuario_id', 'exercicio_id'],
+            set_={'tentativas': tabela.c.tentativas + 1}
+        )
+    )
+
+    if novo_progresso:
+        # Na mesma transação do progresso: o cache de exercícios_concluidos de todos os workers expira junto
+        usuarios = Usuario.__table__
+        db.session.execute(
+            update(usuarios)
+            .where(usuarios.c.id == usuario_id)
+            .values(versao_progresso=usuarios.c.versao_progresso + 1)
+        )
+
+    if exercicio.eh_desafio_final:
+        db.session.execute(
+            insert_com_conflito(ModuloConcluido)
+            .values(usuario_id=usuario_id, modulo=exercicio.modulo)
+            .on_conflict_do_nothing(index_elements=['usuario_id', 'modulo'])
+        )
+
+
+def registrar_tentativa_errada(usuario_id, exercicio_id):
+    """Soma uma tentativa se o exercício já foi concluído; retorna se havia progresso"""
+    tabela = Progresso.__table__
+    resultado = db.session.execute(
+        update(tabela)
+        .where(tabela.c.usuario_id == usuario_id, tabela.c.exercicio_id == exercicio_id)
+        .values(tentativas=tabela.c.tentativas + 1)
+    )
+    return resultado.rowcount > 0
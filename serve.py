@@ -1,8 +1,9 @@
 from waitress import serve
-from wsgi import application
+from wsgi import application, preparar_worker
 import os
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
+    preparar_worker(conexoes=4)  # waitress atende com 4 threads por padrão
     print(f"🚀 Servidor iniciando na porta {port}...")
     serve(application, host='0.0.0.0', port=port)
\ No newline at end of file
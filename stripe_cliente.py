@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+
+# Validade dos preços em cache; depois disso um refresh em segundo plano busca de novo
+PRECO_CACHE_TTL = int(os.environ.get('PRECO_CACHE_TTL', 3600))
+
+
+def threads_por_worker():
+    """Threads de requisição de cada worker, pela mesma configuração do gunicorn_config.py"""
+    if os.environ.get('GUNICORN_PERFIL', 'gthread') != 'gthread':
+        return 1
+    return int(os.environ.get('GUNICORN_THREADS', 4))
+
+
+# Quem chama a Stripe espera a resposta na própria thread de requisição: chamadas admitidas
+# (em execução + na fila) ficam abaixo das threads do worker, sobrando ao menos uma para as
+# páginas de aprendizado. Sem fila, o excesso falha na hora com StripeOcupado.
+LIMITE_STRIPE = max(1, threads_por_worker() - 1)
+STRIPE_MAX_CONCORRENCIA = min(int(os.environ.get('STRIPE_MAX_CONCORRENCIA', LIMITE_STRIPE)), LIMITE_STRIPE)
+STRIPE_FILA_MAX = max(0, min(int(os.environ.get('STRIPE_FILA_MAX', 0)), LIMITE_STRIPE - STRIPE_MAX_CONCORRENCIA))
+# Prazo padrão de cada chamada
+STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 10))
+# Retentativas de rede da biblioteca (com jitter)
+STRIPE_RETENTATIVAS = int(os.environ.get('STRIPE_RETENTATIVAS', 2))
+
+
+def configurar_stripe(cliente=None):
+    """Importa o SDK da Stripe e instala nele o cliente HTTP compartilhado.
+
+    Com retentativas ativas a biblioteca repete apenas erros de rede, 409 e 5xx,
+    com backoff e jitter, e envia uma Idempotency-Key em todo POST, reaproveitada
+    nas retentativas da mesma chamada.
+    """
+    import stripe
+    from stripe_http import ClienteHttpStripe
+
+    cliente = cliente or ClienteHttpStripe()
+    stripe.default_http_client = cliente
+    stripe.max_network_retries = STRIPE_RETENTATIVAS
+    return stripe, cliente
+
+
+class SdkStripe:
+    """Módulo stripe carregado no primeiro uso: a subida dos workers não paga o import do SDK.
+
+    Atributos desconhecidos (checkout, Refund, error...) vêm do módulo real.
+    """
+
+    def __init__(self, api_key=None, api_base=None):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.cliente_http = None
+        self._modulo = None
+        self._lock = threading.Lock()
+
+    @property
+    def carregado(self):
+        return self._modulo is not None
+
+    def carregar(self):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    inicio = time.monotonic()
+                    modulo, self.cliente_http = configurar_stripe()
+                    modulo.api_key = self.api_key
+                    if self.api_base:
+                        modulo.api_base = self.api_base
+                    self._modulo = modulo
+                    print(f"💳 SDK da Stripe carregado em {(time.monotonic() - inicio) * 1000:.0f} ms")
+        return self._modulo
+
+    def __getattr__(self, nome):
+        if nome.startswith('_'):
+            raise AttributeError(nome)
+        return getattr(self.carregar(), nome)
+
+    def estatisticas_pool(self):
+        return self.cliente_http.estatisticas() if self.cliente_http else {}
+
+
+class StripeOcupado(Exception):
+    """A fila de chamadas à Stripe está cheia; a requisição é recusada na hora"""
+
+
+class StripeTimeout(Exception):
+    """A chamada à Stripe passou do prazo"""
+
+
+class ExecutorStripe:
+    """Pool próprio e limitado para chamadas à Stripe, com prazo por chamada e métricas de fila"""
+
+    def __init__(self, max_concorrencia=STRIPE_MAX_CONCORRENCIA, fila_max=STRIPE_FILA_MAX, timeout=STRIPE_TIMEOUT):
+        self.max_concorrencia = max_concorrencia
+        self.fila_max = fila_max
+        self.timeout = timeout
+        self._vagas = threading.BoundedSemaphore(max_concorrencia + fila_max)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._em_execucao = 0
+        self._pendentes = 0
+        self._contadores = {'concluidas': 0, 'erros': 0, 'timeouts': 0, 'recusadas': 0}
+        self._latencias = deque(maxlen=500)
+
+    def _obter_pool(self):
+        # Threads não sobrevivem ao fork do gunicorn: cada processo cria o seu pool
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_concorrencia, thread_name_prefix='stripe')
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _contar(self, chave):
+        with self._lock:
+            self._contadores[chave] += 1
+
+    def chamar(self, funcao, *args, timeout=None, **kwargs):
+        """Executa `funcao(*args, **kwargs)` no pool da Stripe e espera no máximo `timeout` segundos"""
+        if not self._vagas.acquire(blocking=False):
+            self._contar('recusadas')
+            raise StripeOcupado('Muitas chamadas à Stripe em andamento')
+
+        with self._lock:
+            self._pendentes += 1
+
+        def executar():
+            with self._lock:
+                self._pendentes -= 1
+                self._em_execucao += 1
+            inicio = time.monotonic()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._em_execucao -= 1
+                    self._latencias.append(time.monotonic() - inicio)
+                self._vagas.release()
+
+        futuro = self._obter_pool().submit(executar)
+        try:
+            resultado = futuro.result(timeout=timeout or self.timeout)
+        except FuturoTimeout:
+            self._contar('timeouts')
+            raise StripeTimeout(f'Stripe não respondeu em {timeout or self.timeout:.0f}s')
+        except Exception:
+            self._contar('erros')
+            raise
+        self._contar('concluidas')
+        return resultado
+
+    def metricas(self):
+        with self._lock:
+            latencias = sorted(self._latencias)
+            dados = {
+                'em_execucao': self._em_execucao,
+                'na_fila': self._pendentes,
+                'max_concorrencia': self.max_concorrencia,
+                'fila_max': self.fila_max,
+                **self._contadores
+            }
+        if latencias:
+            dados['latencia_media_ms'] = round(sum(latencias) / len(latencias) * 1000, 1)
+            dados['latencia_p95_ms'] = round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))] * 1000, 1)
+        return dados
+
+
+class CachePrecos:
+    """Cache dos objetos Price da Stripe, com refresh em segundo plano e fallback para o valor antigo"""
+
+    def __init__(self, price_ids, buscar, ttl=PRECO_CACHE_TTL, executor=None):
+        self.price_ids = price_ids
+        self.ttl = ttl
+        self._buscar = buscar
+        # Buscas feitas por uma requisição passam pelo executor, com fila limitada e prazo
+        self.executor = executor
+        self._precos = {}
+        self._lock = threading.Lock()
+        self._lock_inicio = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _atualizar(self, chave, executor=None):
+        price_id = self.price_ids.get(chave)
+        if not price_id:
+            return None
+        price = executor.chamar(self._buscar, price_id) if executor else self._buscar(price_id)
+        with self._lock:
+            self._precos[chave] = (price, time.monotonic())
+        return price
+
+    def aquecer(self):
+        """Busca todos os preços configurados; falhas mantêm o valor anterior"""
+        for chave, price_id in self.price_ids.items():
+            if not price_id:
+                continue
+            try:
+                price = self._atualizar(chave)
+                print(f"✅ Preço em cache: {chave} = {price.id} - {price.unit_amount} {price.currency}")
+            except Exception as e:
+                print(f"⚠️ Falha ao atualizar preço {chave}, mantendo cache anterior: {str(e)}")
+
+    def iniciar(self):
+        """Inicia neste processo a thread que aquece o cache e o mantém atualizado; não bloqueia"""
+        with self._lock_inicio:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='cache-precos-stripe', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            self.aquecer()
+            time.sleep(max(1, self.ttl))
+
+    def obter(self, chave):
+        """Price da chave (ex.: 'assinatura'); só chama a Stripe se nunca foi carregado"""
+        if self._pid != os.getpid():
+            # Primeira requisição de pagamento do processo (threads não sobrevivem ao fork):
+            # inicia aqui o refresh, que importa o SDK, em vez de na subida do worker
+            self.iniciar()
+        with self._lock:
+            item = self._precos.get(chave)
+        if item:
+            return item[0]
+        # Cache ainda frio: busca só a chave pedida, sem esperar o aquecimento dos demais preços
+        return self._atualizar(chave, self.executor)
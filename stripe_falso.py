@@ -0,0 +1,487 @@
+"""Servidor local que imita a parte da API da Stripe usada pelo Codignarte.
+
+Implementa Price, checkout.Session, Refund e o envio de webhooks assinados, com
+latência e falhas configuráveis, para testar e medir os fluxos de pagamento sem
+uma conta na Stripe.
+
+Uso:
+    python stripe_falso.py --porta 12111 --webhook-url http://127.0.0.1:5000/webhook/stripe \\
+        --latencia-ms 250 --taxa-erro 0.02
+
+No app: STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_SECRET_KEY=sk_test_falso
+        STRIPE_WEBHOOK_SECRET=whsec_falso (o mesmo segredo passado ao servidor)
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import os
+import random
+import secrets
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+
+def _novo_id(prefixo):
+    return f"{prefixo}_test_{secrets.token_hex(12)}"
+
+
+def _desaninhar(pares):
+    """Converte o form da biblioteca stripe (metadata[user_id]=1, line_items[0][price]=...) em dicts e listas"""
+    raiz = {}
+    for chave, valor in pares:
+        partes = chave.replace(']', '').split('[')
+        atual = raiz
+        for parte, seguinte in zip(partes, partes[1:]):
+            atual = atual.setdefault(parte or str(len(atual)), {})
+        atual[partes[-1] or str(len(atual))] = valor
+
+    def converter(valor):
+        if not isinstance(valor, dict):
+            return valor
+        if valor and all(k.isdigit() for k in valor):
+            return [converter(valor[k]) for k in sorted(valor, key=int)]
+        return {k: converter(v) for k, v in valor.items()}
+
+    return converter(raiz)
+
+
+def assinar_webhook(payload, segredo, momento=None):
+    """Cabeçalho Stripe-Signature no mesmo formato que stripe.Webhook.construct_event verifica"""
+    momento = int(momento or time.time())
+    assinatura = hmac.new(segredo.encode(), f"{momento}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={momento},v1={assinatura}"
+
+
+class ErroStripe(Exception):
+    def __init__(self, status, tipo, mensagem, codigo=None):
+        super().__init__(mensagem)
+        self.status = status
+        self.corpo = {'error': {'type': tipo, 'message': mensagem, 'code': codigo}}
+
+
+class EstadoStripe:
+    """Objetos criados durante a execução, protegidos por um único lock"""
+
+    def __init__(self, precos=None, atraso_reembolso=2.0, taxa_falha_reembolso=0.0):
+        self.precos = dict(precos or {})
+        self.atraso_reembolso = atraso_reembolso
+        self.taxa_falha_reembolso = taxa_falha_reembolso
+        self.sessoes = {}
+        self.reembolsos = {}
+        self.idempotencia = {}
+        self.lock = threading.Lock()
+
+    def preco(self, price_id):
+        return {
+            'id': price_id,
+            'object': 'price',
+            'active': True,
+            'currency': 'brl',
+            'unit_amount': self.precos.get(price_id, 1000),
+            'type': 'recurring' if 'assin' in price_id else 'one_time'
+        }
+
+    def criar_sessao(self, params, base):
+        itens = params.get('line_items') or []
+        price_id = itens[0].get('price') if itens else None
+        sessao_id = _novo_id('cs')
+        sessao = {
+            'id': sessao_id,
+            'object': 'checkout.session',
+            'url': f"{base}/_falso/checkout/{sessao_id}",
+            'mode': params.get('mode', 'payment'),
+            'status': 'open',
+            'payment_status': 'unpaid',
+            'payment_intent': None,
+            'subscription': None,
+            'customer_email': params.get('customer_email'),
+            'metadata': params.get('metadata') or {},
+            'success_url': params.get('success_url'),
+            'cancel_url': params.get('cancel_url'),
+            'amount_total': self.preco(price_id)['unit_amount'] if price_id else 0,
+            'currency': 'brl',
+            'created': int(time.time()),
+            'expires_at': int(params.get('expires_at') or time.time() + 24 * 3600)
+        }
+        with self.lock:
+            self.sessoes[sessao_id] = sessao
+        return sessao
+
+    def obter_sessao(self, sessao_id):
+        with self.lock:
+            sessao = self.sessoes.get(sessao_id)
+            if sessao and sessao['status'] == 'open' and sessao['expires_at'] < time.time():
+                sessao['status'] = 'expired'
+        if not sessao:
+            raise ErroStripe(404, 'invalid_request_error', f"No such checkout.session: '{sessao_id}'", 'resource_missing')
+        return sessao
+
+    def pagar_sessao(self, sessao_id):
+        sessao = self.obter_sessao(sessao_id)
+        with self.lock:
+            if sessao['payment_status'] == 'paid':
+                return sessao, False
+            sessao['payment_status'] = 'paid'
+            sessao['status'] = 'complete'
+            sessao['payment_intent'] = _novo_id('pi')
+            if sessao['mode'] == 'subscription':
+                sessao['subscription'] = _novo_id('sub')
+        return sessao, True
+
+    def criar_reembolso(self, params):
+        payment_intent = params.get('payment_intent')
+        with self.lock:
+            sessao = next((s for s in self.sessoes.values() if s['payment_intent'] == payment_intent), None)
+        if not sessao:
+            raise ErroStripe(400, 'invalid_request_error', f"No such payment_intent: '{payment_intent}'", 'resource_missing')
+
+        reembolso = {
+            'id': _novo_id('re'),
+            'object': 'refund',
+            'amount': int(params.get('amount') or sessao['amount_total']),
+            'currency': sessao['currency'],
+            'payment_intent': payment_intent,
+            'charge': _novo_id('ch'),
+            'status': 'pending',
+            'reason': params.get('reason'),
+            'failure_reason': None,
+            'metadata': params.get('metadata') or {},
+            'created': int(time.time()),
+            # Campo interno: quando o reembolso deixa de estar pendente
+            '_conclui_em': time.time() + self.atraso_reembolso,
+            '_falha': random.random() < self.taxa_falha_reembolso
+        }
+        with self.lock:
+            self.reembolsos[reembolso['id']] = reembolso
+        return reembolso
+
+    def _atualizar_reembolso(self, reembolso):
+        """Conclui o reembolso quando o atraso configurado passa; retorna True se mudou agora"""
+        if reembolso['status'] != 'pending' or reembolso['_conclui_em'] > time.time():
+            return False
+        if reembolso['_falha']:
+            reembolso['status'] = 'failed'
+            reembolso['failure_reason'] = 'expired_or_canceled_card'
+        else:
+            reembolso['status'] = 'succeeded'
+        return True
+
+    def obter_reembolso(self, reembolso_id):
+        with self.lock:
+            reembolso = self.reembolsos.get(reembolso_id)
+            if reembolso:
+                self._atualizar_reembolso(reembolso)
+        if not reembolso:
+            raise ErroStripe(404, 'invalid_request_error', f"No such refund: '{reembolso_id}'", 'resource_missing')
+        return reembolso
+
+    def listar_reembolsos(self, params):
+        criado = params.get('created') or {}
+        desde = int(criado.get('gte', 0)) if isinstance(criado, dict) else 0
+        limite = min(100, int(params.get('limit', 10)))
+        payment_intent = params.get('payment_intent')
+        with self.lock:
+            for reembolso in self.reembolsos.values():
+                self._atualizar_reembolso(reembolso)
+            # Mais recentes primeiro, como na Stripe
+            todos = sorted((r for r in self.reembolsos.values() if r['created'] >= desde
+                            and (not payment_intent or r['payment_intent'] == payment_intent)),
+                           key=lambda r: (r['created'], r['id']), reverse=True)
+        depois_de = params.get('starting_after')
+        if depois_de:
+            ids = [r['id'] for r in todos]
+            todos = todos[ids.index(depois_de) + 1:] if depois_de in ids else []
+        return {'object': 'list', 'url': '/v1/refunds', 'data': todos[:limite], 'has_more': len(todos) > limite}
+
+    def reembolsos_concluidos(self):
+        """Reembolsos que acabaram de sair de 'pending' (para o envio de webhooks)"""
+        with self.lock:
+            return [dict(r) for r in self.reembolsos.values() if self._atualizar_reembolso(r)]
+
+
+class ServidorStripeFalso:
+    """Servidor HTTP(S) da Stripe falsa; `iniciar()` retorna a URL base para stripe.api_base"""
+
+    def __init__(self, porta=0, latencia_ms=0.0, sigma=0.6, taxa_erro=0.0, taxa_limite=0.0,
+                 taxa_timeout=0.0, timeout_s=30.0, webhook_url=None, webhook_segredo='whsec_falso',
+                 precos=None, atraso_reembolso=2.0, taxa_falha_reembolso=0.0, tls=False):
+        self.porta = porta
+        self.latencia_ms = latencia_ms
+        self.sigma = sigma
+        self.taxa_erro = taxa_erro
+        self.taxa_limite = taxa_limite
+        self.taxa_timeout = taxa_timeout
+        self.timeout_s = timeout_s
+        self.webhook_url = webhook_url
+        self.webhook_segredo = webhook_segredo
+        self.tls = tls
+        self.estado = EstadoStripe(precos, atraso_reembolso, taxa_falha_reembolso)
+        self.base = None
+        self.conexoes = 0
+        self.requisicoes = 0
+        self.webhooks_enviados = 0
+        self._httpd = None
+        self._parar = threading.Event()
+
+    # Latência e falhas -----------------------------------------------------
+
+    def _esperar_latencia(self):
+        if self.latencia_ms > 0:
+            # Log-normal com mediana latencia_ms: cauda longa como a de uma API real
+            time.sleep(random.lognormvariate(math.log(self.latencia_ms), self.sigma) / 1000)
+
+    def _falha_injetada(self):
+        sorteio = random.random()
+        if sorteio < self.taxa_timeout:
+            time.sleep(self.timeout_s)
+            return ErroStripe(504, 'api_error', 'Timeout simulado')
+        sorteio -= self.taxa_timeout
+        if sorteio < self.taxa_limite:
+            return ErroStripe(429, 'invalid_request_error', 'Rate limit simulado', 'rate_limit')
+        sorteio -= self.taxa_limite
+        if sorteio < self.taxa_erro:
+            return ErroStripe(500, 'api_error', 'Erro interno simulado')
+        return None
+
+    # Webhooks --------------------------------------------------------------
+
+    def enviar_evento(self, tipo, objeto):
+        """Entrega um evento assinado ao webhook configurado, em segundo plano"""
+        if not self.webhook_url:
+            return None
+        evento = {
+            'id': _novo_id('evt'),
+            'object': 'event',
+            'type': tipo,
+            'created': int(time.time()),
+            'livemode': False,
+            'api_version': '2023-08-16',
+            'data': {'object': {k: v for k, v in objeto.items() if not k.startswith('_')}}
+        }
+        threading.Thread(target=self._entregar, args=(evento,), daemon=True).start()
+        return evento
+
+    def _entregar(self, evento, tentativas=5):
+        payload = json.dumps(evento)
+        for tentativa in range(tentativas):
+            requisicao = urllib.request.Request(self.webhook_url, data=payload.encode(), method='POST', headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': assinar_webhook(payload, self.webhook_segredo)
+            })
+            try:
+                with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+                    if resposta.status < 300:
+                        self.webhooks_enviados += 1
+                        return
+            except Exception as e:
+                print(f"⚠️ Webhook {evento['type']} falhou (tentativa {tentativa + 1}): {str(e)}")
+            time.sleep(min(30, 2 ** tentativa))
+
+    def _vigiar_reembolsos(self):
+        # Reembolsos concluem sozinhos após o atraso; a Stripe avisa com charge.refunded
+        while not self._parar.wait(0.5):
+            for reembolso in self.estado.reembolsos_concluidos():
+                if reembolso['status'] == 'succeeded':
+                    self.enviar_evento('charge.refunded', {
+                        'id': reembolso['charge'],
+                        'object': 'charge',
+                        'status': 'succeeded',
+                        'refunded': True,
+                        'amount': reembolso['amount'],
+                        'amount_refunded': reembolso['amount'],
+                        'currency': reembolso['currency'],
+                        'payment_intent': reembolso['payment_intent']
+                    })
+
+    # Rotas -----------------------------------------------------------------
+
+    def responder(self, metodo, caminho, params, cabecalhos):
+        partes = [p for p in caminho.split('/') if p]
+
+        if partes[:1] == ['_falso']:
+            return self._rota_falso(metodo, partes[1:])
+
+        if not cabecalhos.get('Authorization', '').startswith('Bearer '):
+            raise ErroStripe(401, 'invalid_request_error', 'You did not provide an API key.')
+
+        self._esperar_latencia()
+        falha = self._falha_injetada()
+        if falha:
+            raise falha
+
+        chave = cabecalhos.get('Idempotency-Key') if metodo == 'POST' else None
+        if chave:
+            with self.estado.lock:
+                anterior = self.estado.idempotencia.get(chave)
+            if anterior:
+                return 200, anterior, {'Idempotent-Replayed': 'true'}
+
+        status, corpo = self._rota_api(metodo, partes, params)
+        if chave and status < 500:
+            with self.estado.lock:
+                self.estado.idempotencia[chave] = corpo
+        return status, corpo, {}
+
+    def _rota_api(self, metodo, partes, params):
+        publico = lambda objeto: {k: v for k, v in objeto.items() if not k.startswith('_')}
+
+        if partes[:2] == ['v1', 'prices'] and len(partes) == 3 and metodo == 'GET':
+            return 200, self.estado.preco(partes[2])
+        if partes[:3] == ['v1', 'checkout', 'sessions']:
+            if len(partes) == 3 and metodo == 'POST':
+                return 200, self.estado.criar_sessao(params, self.base)
+            if len(partes) == 4 and metodo == 'GET':
+                return 200, self.estado.obter_sessao(partes[3])
+        if partes[:2] == ['v1', 'refunds']:
+            if len(partes) == 2 and metodo == 'POST':
+                return 200, publico(self.estado.criar_reembolso(params))
+            if len(partes) == 2 and metodo == 'GET':
+                lista = self.estado.listar_reembolsos(params)
+                return 200, {**lista, 'data': [publico(r) for r in lista['data']]}
+            if len(partes) == 3 and metodo == 'GET':
+                return 200, publico(self.estado.obter_reembolso(partes[2]))
+        raise ErroStripe(404, 'invalid_request_error', f"Unrecognized request URL ({metodo} /{'/'.join(partes)})")
+
+    def _rota_falso(self, metodo, partes):
+        """Rotas de controle: página de checkout que paga na hora e estatísticas"""
+        if partes[:1] == ['checkout'] and len(partes) == 2:
+            sessao, pagou_agora = self.estado.pagar_sessao(partes[1])
+            if pagou_agora:
+                self.enviar_evento('checkout.session.completed', sessao)
+            destino = (sessao['success_url'] or '/').replace('{CHECKOUT_SESSION_ID}', sessao['id'])
+            return 303, {}, {'Location': destino}
+        if partes == ['status']:
+            return 200, {
+                'conexoes': self.conexoes,
+                'requisicoes': self.requisicoes,
+                'webhooks_enviados': self.webhooks_enviados,
+                'sessoes': len(self.estado.sessoes),
+                'reembolsos': len(self.estado.reembolsos)
+            }, {}
+        raise ErroStripe(404, 'invalid_request_error', 'Rota de controle desconhecida')
+
+    # Servidor --------------------------------------------------------------
+
+    def iniciar(self, diretorio_certificado=None):
+        servidor = self
+
+        class Manipulador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                servidor.conexoes += 1
+
+            def _tratar(self, metodo):
+                servidor.requisicoes += 1
+                url = urlsplit(self.path)
+                tamanho = int(self.headers.get('Content-Length') or 0)
+                corpo = self.rfile.read(tamanho).decode() if tamanho else ''
+                params = _desaninhar(parse_qsl(url.query) + parse_qsl(corpo))
+                try:
+                    status, dados, extras = servidor.responder(metodo, url.path, params, self.headers)
+                except ErroStripe as e:
+                    status, dados, extras = e.status, e.corpo, {}
+                    if status >= 500:
+                        extras['Stripe-Should-Retry'] = 'true'
+
+                resposta = json.dumps(dados).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(resposta)))
+                self.send_header('Request-Id', _novo_id('req'))
+                for nome, valor in extras.items():
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(resposta)
+
+            def do_GET(self):
+                self._tratar('GET')
+
+            def do_POST(self):
+                self._tratar('POST')
+
+            def do_DELETE(self):
+                self._tratar('DELETE')
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', self.porta), Manipulador)
+        self._httpd.daemon_threads = True
+        esquema = 'http'
+        if self.tls:
+            self._httpd.socket = self._contexto_tls(diretorio_certificado).wrap_socket(self._httpd.socket, server_side=True)
+            esquema = 'https'
+        self.base = f"{esquema}://127.0.0.1:{self._httpd.server_address[1]}"
+        threading.Thread(target=self._httpd.serve_forever, name='stripe-falso', daemon=True).start()
+        threading.Thread(target=self._vigiar_reembolsos, name='stripe-falso-reembolsos', daemon=True).start()
+        return self.base
+
+    def _contexto_tls(self, diretorio):
+        # Certificado autoassinado: clientes precisam de verify_ssl_certs=False
+        if not shutil.which('openssl'):
+            raise RuntimeError('openssl não encontrado; rode sem TLS')
+        cert, chave = os.path.join(diretorio, 'cert.pem'), os.path.join(diretorio, 'chave.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=127.0.0.1', '-keyout', chave, '-out', cert],
+                       check=True, capture_output=True)
+        contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        contexto.load_cert_chain(cert, chave)
+        return contexto
+
+    def parar(self):
+        self._parar.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stripe falsa para testes e benchmarks locais')
+    parser.add_argument('--porta', type=int, default=12111)
+    parser.add_argument('--webhook-url', help='Endpoint que recebe os eventos (ex.: http://127.0.0.1:5000/webhook/stripe)')
+    parser.add_argument('--webhook-segredo', default=os.environ.get('STRIPE_WEBHOOK_SECRET', 'whsec_falso'))
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Mediana da latência por chamada')
+    parser.add_argument('--sigma', type=float, default=0.6, help='Dispersão log-normal da latência (0.6 ≈ p99 4x a mediana)')
+    parser.add_argument('--taxa-erro', type=float, default=0, help='Fração de respostas 500')
+    parser.add_argument('--taxa-limite', type=float, default=0, help='Fração de respostas 429')
+    parser.add_argument('--taxa-timeout', type=float, default=0, help='Fração de chamadas que só respondem após --timeout-s')
+    parser.add_argument('--timeout-s', type=float, default=30)
+    parser.add_argument('--atraso-reembolso', type=float, default=2, help='Segundos até um reembolso sair de pending')
+    parser.add_argument('--taxa-falha-reembolso', type=float, default=0)
+    parser.add_argument('--preco', action='append', default=[], metavar='PRICE_ID=CENTAVOS')
+    args = parser.parse_args()
+
+    precos = {}
+    for item in args.preco:
+        price_id, _, centavos = item.partition('=')
+        precos[price_id] = int(centavos)
+
+    servidor = ServidorStripeFalso(
+        porta=args.porta, latencia_ms=args.latencia_ms, sigma=args.sigma, taxa_erro=args.taxa_erro,
+        taxa_limite=args.taxa_limite, taxa_timeout=args.taxa_timeout, timeout_s=args.timeout_s,
+        webhook_url=args.webhook_url, webhook_segredo=args.webhook_segredo, precos=precos,
+        atraso_reembolso=args.atraso_reembolso, taxa_falha_reembolso=args.taxa_falha_reembolso
+    )
+    base = servidor.iniciar()
+    print(f"🧪 Stripe falsa em {base} (webhooks: {args.webhook_url or 'desativados'})")
+    print(f"   STRIPE_API_BASE={base} STRIPE_WEBHOOK_SECRET={args.webhook_segredo}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.parar()
+
+
+if __name__ == '__main__':
+    main()
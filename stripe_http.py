@@ -0,0 +1,61 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
+
+from stripe_cliente import STRIPE_MAX_CONCORRENCIA, STRIPE_TIMEOUT
+
+# Conexões keep-alive mantidas abertas com a Stripe
+STRIPE_MAX_CONEXOES = int(os.environ.get('STRIPE_MAX_CONEXOES', STRIPE_MAX_CONCORRENCIA))
+
+
+class ClienteHttpStripe(RequestsClient):
+    """Cliente HTTP da Stripe com um único pool keep-alive compartilhado entre as threads"""
+
+    def __init__(self, max_conexoes=STRIPE_MAX_CONEXOES, timeout=STRIPE_TIMEOUT, **kwargs):
+        super().__init__(timeout=timeout, **kwargs)
+        self.max_conexoes = max_conexoes
+        self._lock_pool = threading.Lock()
+        self._adaptador = None
+        self._pid = None
+
+    def _obter_adaptador(self):
+        # Conexões abertas antes do fork não podem ser reutilizadas pelos workers
+        if self._pid != os.getpid():
+            with self._lock_pool:
+                if self._pid != os.getpid():
+                    self._adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_conexoes, pool_block=True)
+                    self._pid = os.getpid()
+        return self._adaptador
+
+    def _request_internal(self, method, url, headers, post_data, is_streaming):
+        adaptador = self._obter_adaptador()
+        sessao = getattr(self._thread_local, 'session', None)
+        if sessao is None or sessao.get_adapter('https://') is not adaptador:
+            # Uma Session por thread, todas apontando para o mesmo pool de conexões
+            sessao = requests.Session()
+            sessao.mount('https://', adaptador)
+            sessao.mount('http://', adaptador)
+            self._thread_local.session = sessao
+        return super()._request_internal(method, url, headers, post_data, is_streaming)
+
+    def estatisticas(self):
+        """Uso do pool por host: conexões abertas no total, requisições feitas e conexões ociosas"""
+        adaptador = self._adaptador
+        if adaptador is None or self._pid != os.getpid():
+            return {}
+        pools = adaptador.poolmanager.pools
+        dados = {}
+        for chave in list(pools.keys()):
+            pool = pools.get(chave)
+            if pool is None:
+                continue
+            dados[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                'conexoes_abertas': pool.num_connections,
+                'requisicoes': pool.num_requests,
+                'ociosas': pool.pool.qsize() if pool.pool else 0,
+                'max_conexoes': self.max_conexoes
+            }
+        return dados
@@ -0,0 +1,189 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from app import app, db, despachar_evento_stripe, parametros_reembolso, stripe
+from models import Usuario, Transacao
+from webhooks import processar_inbox
+
+# Status de reembolso que ainda dependem de uma resposta da Stripe
+REEMBOLSOS_EM_ANDAMENTO = ('processando', 'solicitado')
+# Folga após o fim da sessão de checkout, para webhooks atrasados chegarem antes da expiração
+TRANSACAO_PENDENTE_MARGEM = int(os.environ.get('TRANSACAO_PENDENTE_MARGEM', 3600))
+# Sessões criadas antes de checkout_expira_em existir usam a validade padrão da Stripe (24 h)
+VALIDADE_PADRAO_STRIPE = 24 * 3600
+
+
+def expirar_premium_vencido(lote=500):
+    """Desativa em lote os usuários cujo premium já expirou"""
+    agora = datetime.utcnow()
+    total = 0
+
+    while True:
+        ids = [row.id for row in db.session.query(Usuario.id).filter(
+            Usuario.premium.is_(True),
+            Usuario.data_expiracao_premium.isnot(None),
+            Usuario.data_expiracao_premium < agora
+        ).limit(lote)]
+
+        if not ids:
+            break
+
+        Usuario.query.filter(Usuario.id.in_(ids)).update({
+            Usuario.premium: False,
+            Usuario.premium_cancelado: False,
+            Usuario.data_inicio_premium: None,
+            Usuario.data_expiracao_premium: None
+        }, synchronize_session=False)
+        db.session.commit()
+        total += len(ids)
+
+    return total
+
+
+def expirar_transacoes_pendentes(lote=500):
+    """Marca como expiradas, em lotes, as transações pendentes cuja sessão de checkout já acabou"""
+    limite = datetime.utcnow() - timedelta(seconds=TRANSACAO_PENDENTE_MARGEM)
+    abandonada = db.or_(
+        Transacao.checkout_expira_em < limite,
+        db.and_(Transacao.checkout_expira_em.is_(None),
+                Transacao.data_transacao < limite - timedelta(seconds=VALIDADE_PADRAO_STRIPE))
+    )
+    total = 0
+
+    while True:
+        ids = [row.id for row in db.session.query(Transacao.id).filter(
+            Transacao.status == 'pendente', abandonada
+        ).limit(lote)]
+
+        if not ids:
+            break
+
+        # Reaplica o filtro de status: um webhook pode ter confirmado a transação entre as duas consultas
+        total += Transacao.query.filter(
+            Transacao.id.in_(ids),
+            Transacao.status == 'pendente'
+        ).update({Transacao.status: 'expirada'}, synchronize_session=False)
+        db.session.commit()
+
+    return total
+
+
+def processar_webhooks():
+    """Aplica os eventos da Stripe acumulados na caixa de entrada"""
+    return processar_inbox(despachar_evento_stripe)
+
+
+def _buscar_refunds(refund_ids, desde):
+    """Status dos refunds na Stripe, paginando a listagem em vez de um retrieve por refund"""
+    faltando = set(refund_ids)
+    encontrados = {}
+    for refund in stripe.Refund.list(created={'gte': int(desde.replace(tzinfo=timezone.utc).timestamp())}, limit=100).auto_paging_iter():
+        if refund.id in faltando:
+            encontrados[refund.id] = refund
+            faltando.discard(refund.id)
+            if not faltando:
+                break
+
+    # Refunds fora da janela listada (data de solicitação ausente ou antiga demais)
+    for refund_id in faltando:
+        encontrados[refund_id] = stripe.Refund.retrieve(refund_id)
+    return encontrados
+
+
+def localizar_reembolsos_sem_resposta():
+    """Refunds enviados sem resposta (timeout): encontra o refund na Stripe ou reenvia com a mesma chave"""
+    transacoes = Transacao.query.filter(
+        Transacao.status_reembolso == 'processando',
+        Transacao.stripe_refund_id.is_(None),
+        Transacao.stripe_payment_intent.isnot(None)
+    ).all()
+    for transacao in transacoes:
+        refund = next((r for r in stripe.Refund.list(payment_intent=transacao.stripe_payment_intent, limit=100).auto_paging_iter()
+                       if (r.get('metadata') or {}).get('transacao_id') == transacao.id_publico), None)
+        if refund is None:
+            # Nunca chegou à Stripe (ou ainda está a caminho): a Idempotency-Key impede um refund duplicado
+            refund = stripe.Refund.create(**parametros_reembolso(transacao))
+        transacao.processar_reembolso(refund.id)
+        db.session.commit()
+        print(f"🔎 Reembolso da transação {transacao.id_publico} localizado na Stripe: {refund.id}")
+    return len(transacoes)
+
+
+def reconciliar_reembolsos():
+    """Atualiza os reembolsos em andamento com o status atual na Stripe"""
+    localizados = localizar_reembolsos_sem_resposta()
+    pendentes = db.session.query(
+        Transacao.id, Transacao.stripe_refund_id, Transacao.data_solicitacao_reembolso
+    ).filter(
+        Transacao.status_reembolso.in_(REEMBOLSOS_EM_ANDAMENTO),
+        Transacao.stripe_refund_id.isnot(None)
+    ).all()
+    db.session.rollback()
+    if not pendentes:
+        return localizados
+
+    datas = [data for _, _, data in pendentes if data]
+    # Margem de um dia para diferenças de relógio entre a solicitação e a criação na Stripe
+    desde = (min(datas) if datas else datetime.utcnow()) - timedelta(days=1)
+    refunds = _buscar_refunds([refund_id for _, refund_id, _ in pendentes], desde)
+
+    concluidos = {refund_id for refund_id, refund in refunds.items()
+                  if refund.status in ('succeeded', 'failed', 'canceled')}
+    if not concluidos:
+        return localizados
+
+    transacoes = Transacao.query.filter(
+        Transacao.id.in_([transacao_id for transacao_id, refund_id, _ in pendentes if refund_id in concluidos]),
+        Transacao.status_reembolso.in_(REEMBOLSOS_EM_ANDAMENTO)
+    ).all()
+    for transacao in transacoes:
+        refund = refunds[transacao.stripe_refund_id]
+        if refund.status == 'succeeded':
+            transacao.completar_reembolso({
+                'refund_id': refund.id,
+                'amount': refund.amount / 100,
+                'currency': refund.currency,
+                'status': refund.status
+            })
+        else:
+            transacao.falhar_reembolso(f"Reembolso falhou na Stripe: {refund.get('failure_reason') or refund.status}")
+    db.session.commit()
+    return localizados + len(transacoes)
+
+
+TAREFAS = {
+    'expirar-premium': expirar_premium_vencido,
+    'expirar-transacoes': expirar_transacoes_pendentes,
+    'processar-webhooks': processar_webhooks,
+    'reconciliar-reembolsos': reconciliar_reembolsos,
+}
+
+
+def executar(nomes, silencioso=False):
+    with app.app_context():
+        for nome in nomes:
+            try:
+                resultado = TAREFAS[nome]()
+                if resultado or not silencioso:
+                    print(f"✅ {nome}: {resultado} registro(s) atualizados")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Erro na tarefa {nome}: {str(e)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tarefas periódicas do Codignarte')
+    parser.add_argument('tarefas', nargs='*', help=f"Tarefas a executar (padrão: todas): {', '.join(TAREFAS)}")
+    parser.add_argument('--intervalo', type=int, default=0, help='Repete a cada N segundos (0 = executa uma vez)')
+    args = parser.parse_args()
+
+    nomes = args.tarefas or list(TAREFAS)
+    desconhecidas = [nome for nome in nomes if nome not in TAREFAS]
+    if desconhecidas:
+        parser.error(f"tarefa(s) desconhecida(s): {', '.join(desconhecidas)}")
+    executar(nomes)
+    while args.intervalo > 0:
+        time.sleep(args.intervalo)
+        executar(nomes, silencioso=True)
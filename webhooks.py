@@ -0,0 +1,166 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import aliased
+
+from models import db, EventoWebhook, insert_com_conflito
+
+WEBHOOK_MAX_TENTATIVAS = int(os.environ.get('WEBHOOK_MAX_TENTATIVAS', 8))
+# Tempo que um worker "segura" um evento; se morrer no meio, outro retoma depois disso
+WEBHOOK_LEASE = int(os.environ.get('WEBHOOK_LEASE', 300))
+
+
+def chave_ordenacao(evento):
+    """Eventos do mesmo pagamento são processados na ordem em que a Stripe os criou"""
+    objeto = evento['data']['object']
+    return objeto.get('payment_intent') or objeto.get('id')
+
+
+def registrar_evento(evento, payload):
+    """Grava o evento bruto na caixa de entrada; repetições do mesmo id são ignoradas"""
+    resultado = db.session.execute(
+        insert_com_conflito(EventoWebhook)
+        .values(
+            id=evento['id'],
+            tipo=evento['type'],
+            payload=payload,
+            chave_ordenacao=chave_ordenacao(evento),
+            criado_em_stripe=evento.get('created'),
+            status='pendente',
+            tentativas=0,
+            proxima_tentativa_em=datetime.utcnow()
+        )
+        .on_conflict_do_nothing(index_elements=['id'])
+    )
+    db.session.commit()
+    return resultado.rowcount > 0
+
+
+def _espera_retentativa(tentativas):
+    """Backoff exponencial: 30s, 1min, 2min... até 1 hora"""
+    return timedelta(seconds=min(3600, 30 * 2 ** max(0, tentativas - 1)))
+
+
+def _reservar(evento_id, tentativas, agora):
+    """Marca o evento como nosso por WEBHOOK_LEASE segundos; falha se outro worker pegou antes"""
+    tabela = EventoWebhook.__table__
+    resultado = db.session.execute(
+        update(tabela)
+        .where(tabela.c.id == evento_id,
+               tabela.c.status == 'pendente',
+               tabela.c.tentativas == tentativas)
+        .values(tentativas=tabela.c.tentativas + 1,
+                proxima_tentativa_em=agora + timedelta(seconds=WEBHOOK_LEASE))
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+
+def processar_inbox(despachar, lote=50):
+    """Drena a caixa de entrada em lote, respeitando a ordem por pagamento.
+
+    `despachar(evento_stripe)` aplica o evento e deve levantar exceção em falhas
+    transitórias, para que o evento seja reagendado com backoff.
+    """
+    agora = datetime.utcnow()
+    anterior = aliased(EventoWebhook)
+    # Um evento anterior do mesmo pagamento ainda pendente (mesmo em backoff) bloqueia os seguintes
+    evento_anterior_pendente = db.session.query(anterior.id).filter(
+        anterior.status == 'pendente',
+        anterior.chave_ordenacao == EventoWebhook.chave_ordenacao,
+        or_(anterior.criado_em_stripe < EventoWebhook.criado_em_stripe,
+            and_(anterior.criado_em_stripe == EventoWebhook.criado_em_stripe,
+                 or_(anterior.recebido_em < EventoWebhook.recebido_em,
+                     and_(anterior.recebido_em == EventoWebhook.recebido_em, anterior.id < EventoWebhook.id))))
+    ).exists()
+    # Filtra prazo (backoff ou lease vencido) e ordem antes do LIMIT: eventos em espera não ocupam o lote
+    pendentes = db.session.query(
+        EventoWebhook.id, EventoWebhook.tipo, EventoWebhook.tentativas
+    ).filter(
+        EventoWebhook.status == 'pendente',
+        or_(EventoWebhook.proxima_tentativa_em.is_(None), EventoWebhook.proxima_tentativa_em <= agora),
+        # Chave nula nunca é igual na comparação: esses eventos não bloqueiam uns aos outros
+        ~evento_anterior_pendente
+    ).order_by(
+        EventoWebhook.criado_em_stripe, EventoWebhook.recebido_em, EventoWebhook.id
+    ).limit(lote).all()
+    db.session.rollback()
+
+    processados = 0
+    for evento_id, tipo, tentativas in pendentes:
+        # Outro worker reservou o evento depois da consulta
+        if not _reservar(evento_id, tentativas, agora):
+            continue
+        tentativas += 1
+
+        try:
+            payload = db.session.query(EventoWebhook.payload).filter_by(id=evento_id).scalar()
+            despachar(json.loads(payload))
+        except Exception as e:
+            db.session.rollback()
+            falhou = tentativas >= WEBHOOK_MAX_TENTATIVAS
+            EventoWebhook.query.filter_by(id=evento_id).update({
+                EventoWebhook.status: 'falhou' if falhou else 'pendente',
+                EventoWebhook.ultimo_erro: str(e)[:2000],
+                EventoWebhook.proxima_tentativa_em: datetime.utcnow() + _espera_retentativa(tentativas)
+            }, synchronize_session=False)
+            db.session.commit()
+            print(f"❌ Webhook {evento_id} ({tipo}) falhou na tentativa {tentativas}: {str(e)}")
+            continue
+
+        EventoWebhook.query.filter_by(id=evento_id).update({
+            EventoWebhook.status: 'processado',
+            EventoWebhook.processado_em: datetime.utcnow(),
+            EventoWebhook.ultimo_erro: None
+        }, synchronize_session=False)
+        db.session.commit()
+        processados += 1
+
+    return processados
+
+
+def reprocessar(ids=None, falhos=False, desde=None):
+    """Devolve eventos para a fila (replay): por id, todos os que falharam ou recebidos desde uma data"""
+    consulta = EventoWebhook.query
+    if ids:
+        consulta = consulta.filter(EventoWebhook.id.in_(ids))
+    elif falhos:
+        consulta = consulta.filter(EventoWebhook.status == 'falhou')
+    elif desde:
+        consulta = consulta.filter(EventoWebhook.recebido_em >= desde)
+    else:
+        return 0
+
+    total = consulta.update({
+        EventoWebhook.status: 'pendente',
+        EventoWebhook.tentativas: 0,
+        EventoWebhook.proxima_tentativa_em: datetime.utcnow(),
+        EventoWebhook.ultimo_erro: None
+    }, synchronize_session=False)
+    db.session.commit()
+    return total
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Caixa de entrada de webhooks da Stripe')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    replay = sub.add_parser('replay', help='Devolve eventos para a fila')
+    replay.add_argument('ids', nargs='*', help='Ids de eventos (evt_...)')
+    replay.add_argument('--falhos', action='store_true', help='Todos os eventos que esgotaram as tentativas')
+    replay.add_argument('--desde', type=datetime.fromisoformat, help='Eventos recebidos desde esta data (AAAA-MM-DD)')
+    sub.add_parser('status', help='Contagem de eventos por status')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.comando == 'replay':
+            total = reprocessar(ids=args.ids, falhos=args.falhos, desde=args.desde)
+            print(f"🔄 {total} evento(s) devolvidos para a fila")
+        else:
+            contagens = db.session.query(EventoWebhook.status, db.func.count()).group_by(EventoWebhook.status)
+            for status, total in contagens:
+                print(f"   {status}: {total}")
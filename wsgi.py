@@ -1,26 +1,48 @@
-from app import app, db
-from models import Exercicio
+import time
+
+# Início da subida do worker, antes dos imports pesados (Flask, SQLAlchemy, modelos)
+INICIO_SUBIDA = time.perf_counter()
+
+from app import app, prontidao
+from aquecimento import aquecer_aplicacao, aquecer_worker, formatar_etapas
+from migracoes import verificar_schema
 import os
 
 def initialize_app():
     """Inicializa a aplicação de forma síncrona"""
+    with app.app_context():
+        # Schema e dados iniciais são do passo de release (init_db.py); aqui só conferimos a versão.
+        # Schema desatualizado impede a subida: melhor falhar o deploy que servir com colunas faltando
+        versao = verificar_schema()
+        print(f"✅ Schema na versão {versao}")
+
     try:
         with app.app_context():
-            print("🔄 Criando tabelas do banco...")
-            db.create_all()
-            print("✅ Tabelas criadas com sucesso!")
-            
-            # Verificar se já existem exercícios
-            if not Exercicio.query.first():
-                print("🔄 Criando dados iniciais...")
-                from app import criar_dados_iniciais
-                criar_dados_iniciais()
-                print("✅ Dados iniciais criados!")
+            # Mappers, rotas, templates e catálogo: com preload, compartilhados por todos os workers
+            etapas = aquecer_aplicacao(app)
             
-            print("🎉 Aplicação inicializada com sucesso!")
+            # SDK e preços da Stripe ficam para a primeira requisição de pagamento
+            prontidao['subida_ms'] = round((time.perf_counter() - INICIO_SUBIDA) * 1000)
+            prontidao['aquecimento'] = etapas
+            print(f"🎉 Aplicação inicializada com sucesso em {prontidao['subida_ms']} ms! ({formatar_etapas(etapas)})")
     except Exception as e:
         print(f"❌ Erro na inicialização: {e}")
 
+def preparar_worker(conexoes=1):
+    """Aquecimento de cada processo (pool e chaves); só depois dele o /pronto responde 200"""
+    inicio = time.perf_counter()
+    try:
+        etapas = aquecer_worker(app, conexoes)
+        print(f"🔥 Worker {os.getpid()} aquecido em {(time.perf_counter() - inicio) * 1000:.0f} ms "
+              f"({formatar_etapas(etapas) or 'aquecimento desligado'})")
+    except Exception as e:
+        # Sem aquecimento o worker ainda atende; a primeira requisição paga o custo
+        etapas = {}
+        print(f"⚠️ Erro no aquecimento do worker {os.getpid()}: {e}")
+    prontidao['aquecimento_worker_ms'] = round((time.perf_counter() - inicio) * 1000)
+    prontidao['aquecimento'] = {**prontidao['aquecimento'], **etapas}
+    prontidao['pronto'] = True
+
 # Inicializar a aplicação
 initialize_app()
 
@@ -29,6 +51,7 @@ application = app
 
 if __name__ == "__main__":
     # Para desenvolvimento local
+    preparar_worker()
     port = int(os.environ.get("PORT", 5000))
     debug = os.environ.get("FLASK_DEBUG", "False").lower() == "true"
     application.run(host="0.0.0.0", port=port, debug=debug)
\ No newline at end of file